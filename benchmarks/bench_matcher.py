@@ -0,0 +1,64 @@
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from keyword_compiler import load_keywords
+from keyword_filter_regex import build_pattern
+from motif_matcher import MotifMatcher
+
+FILLER = ['Grabstein', 'mit', 'Inschrift', 'und', 'Darstellung', 'eines', 'im', 'Giebel', 'links', 'rechts', 'oben', 'Rahmen']
+
+
+# pad the real keyword list with synthetic German-looking nouns
+def synthetic_keywords(keywords, count, rng):
+    result = list(dict.fromkeys(keywords))
+    while len(result) < count:
+        result.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12))).capitalize())
+    return result[:count]
+
+
+def synthetic_commentaries(keywords, count, rng):
+    commentaries = []
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(10, 60))]
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords) + rng.choice(['', 'e', 'es', 'en', 'n', 's']))
+        commentaries.append(' '.join(words) + '.')
+    return commentaries
+
+
+def timed(matcher, commentaries):
+    start = time.perf_counter()
+    matches = [matcher.findall(commentary) for commentary in commentaries]
+    return time.perf_counter() - start, matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the trie matcher with the alternation regex for growing keyword lists.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[150, 500, 1000, 2000, 5000])
+    parser.add_argument('--commentaries', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keywords = load_keywords(os.path.join(SRC_DIR, 'keywords.txt'))
+
+    print(f"{'keywords':>8} {'regex [s]':>10} {'trie [s]':>10} {'speedup':>8}  same output")
+    for size in args.sizes:
+        size_keywords = synthetic_keywords(keywords, size, rng)
+        commentaries = synthetic_commentaries(size_keywords, args.commentaries, rng)
+
+        regex_time, regex_matches = timed(build_pattern(size_keywords), commentaries)
+        trie_time, trie_matches = timed(MotifMatcher(size_keywords), commentaries)
+
+        print(f"{size:>8} {regex_time:>10.3f} {trie_time:>10.3f} {regex_time / trie_time:>7.1f}x  {regex_matches == trie_matches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from synthetic_corpus import ensure_corpus
+
+BASELINES_PATH = os.path.join(BENCH_DIR, 'baselines.json')
+WORK_DIR = os.path.join(BENCH_DIR, 'work')
+
+# input files the scripts expect next to them
+SOURCE_FILES = ['keywords.txt', 'keyword_groups.txt', 'mapdata']
+
+
+# peak resident set size so far of the process and of its largest finished child (render workers), in MB
+def peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+
+# how much a stage raised the peaks, ru_maxrss never goes down, so a stage below an earlier peak grows by 0
+def peak_rss_growth_mb(before, after):
+    return max(after[0] - before[0], after[1] - before[1])
+
+
+# the scripts use paths relative to src/, the benchmark runs in its own directory so the real caches stay untouched
+def prepare_work_dir(work_dir):
+    os.makedirs(work_dir, exist_ok=True)
+    for name in SOURCE_FILES:
+        target = os.path.join(work_dir, name)
+        if not os.path.lexists(target):
+            os.symlink(os.path.abspath(os.path.join(SRC_DIR, name)), target)
+
+
+# run every stage once on one corpus and return the per-stage measurements
+def run_stages(corpus, work_dir, matcher_mode='trie', workers=4):
+    prepare_work_dir(work_dir)
+    os.chdir(work_dir)
+
+    from filtered_io import load_filtered_data, save_filtered_data
+    from ingest import load_corpus
+    from keyword_analysis import build_figures, cached_world, render_all
+    from keyword_compiler import load_artifact
+    from keyword_filter_regex import add_christian_column, build_matcher, find_matches, find_motifs_and_filter
+    from lemmatizer import TableLemmatizer
+    from motif_cube import build_cube
+    from motif_matrix import MotifMatrix
+
+    artifact = load_artifact('keywords.txt', 'keyword_groups.txt')
+    motif_to_group = artifact['motif_to_group']
+    # parsing the shapefile is a one-off cost, not part of the aggregation
+    cached_world()
+
+    measurements = []
+    state = {}
+
+    def stage(name, function, rows):
+        peak_before = peak_rss_mb()
+        start, cpu_start = time.perf_counter(), time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        seconds = time.perf_counter() - start
+        row_count = rows()
+        measurements.append({
+            'stage': name,
+            'seconds': seconds,
+            'cpu_seconds': time.process_time() - cpu_start,
+            'rows': row_count,
+            'rows_per_second': row_count / seconds if seconds > 0 else None,
+            'peak_rss_mb': max(peak_rss_mb()),
+            'peak_rss_growth_mb': peak_rss_growth_mb(peak_before, peak_rss_mb()),
+        })
+
+    def ingest():
+        state['df'] = load_corpus(corpus)
+        state['commentaries'] = state['df']['commentary'].tolist()
+
+    def matching():
+        matcher = build_matcher(artifact, matcher_mode)
+        state['matches'] = [find_matches(commentary, matcher) for commentary in state['commentaries']]
+
+    # the Stanza-free table lemmatizer, so the benchmark does not depend on the models
+    def lemmatization():
+        surfaces = {match for row_matches in state['matches'] for match in row_matches}
+        lemmas = TableLemmatizer(artifact['inflection_table']).lemmatize(surfaces)
+        state['results'] = [find_motifs_and_filter(row_matches, lemmas) for row_matches in state['matches']]
+
+    def christian():
+        motif_matrix = MotifMatrix.from_rows(state['results'], motif_to_group)
+        has_motifs = motif_matrix.has_motifs()
+        state['motif_matrix'] = motif_matrix.take(has_motifs)
+        state['filtered_df'] = add_christian_column(state['df'][has_motifs], state['motif_matrix'])
+
+    def aggregation():
+        cube = build_cube(load_filtered_data(state['filtered_path']))
+        state['figures'] = build_figures(cube)
+
+    def rendering():
+        render_dir = tempfile.mkdtemp(prefix='render-', dir=work_dir)
+        try:
+            render_all(state['figures'], render_dir, workers)
+        finally:
+            shutil.rmtree(render_dir)
+
+    stage('ingest', ingest, lambda: len(state['df']))
+    stage('matching', matching, lambda: len(state['commentaries']))
+    stage('lemmatization', lemmatization, lambda: len(state['commentaries']))
+    stage('christian', christian, lambda: len(state['commentaries']))
+
+    # writing the filtered data is not timed, the analysis starts from the file
+    state['filtered_path'] = os.path.join(work_dir, 'filtered_data.arrow')
+    save_filtered_data(state['filtered_df'], state['motif_matrix'], state['filtered_path'], 'arrow')
+
+    stage('aggregation', aggregation, lambda: len(state['filtered_df']))
+    stage('rendering', rendering, lambda: len(state['figures']))
+    return measurements
+
+
+# every size runs in a fresh interpreter, so the peak RSS of one size does not leak into the next
+def run_size(rows, seed, matcher_mode, workers):
+    corpus = ensure_corpus(rows, seed)
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        report_path = f.name
+    try:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-one', corpus, '--report', report_path,
+             '--matcher', matcher_mode, '--workers', str(workers)],
+            check=True, env=dict(os.environ, MPLBACKEND='Agg')
+        )
+        with open(report_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(report_path)
+
+
+# stages that are slower or raise the peak RSS more than in the baseline, by more than the tolerance
+def compare(results, baselines, tolerance, min_seconds, min_rss_mb):
+    regressions = []
+    for size, measurements in results.items():
+        baseline = {m['stage']: m for m in baselines.get(size, [])}
+        for measurement in measurements:
+            base = baseline.get(measurement['stage'])
+            measurement['status'] = 'new'
+            if base is None:
+                continue
+            slower = (measurement['seconds'] > base['seconds'] * (1 + tolerance)
+                      and measurement['seconds'] - base['seconds'] > min_seconds)
+            # the peak of the process belongs to the heaviest stage so far, each stage is compared by its own growth
+            larger = ('peak_rss_growth_mb' in base
+                      and measurement['peak_rss_growth_mb'] > base['peak_rss_growth_mb'] * (1 + tolerance)
+                      and measurement['peak_rss_growth_mb'] - base['peak_rss_growth_mb'] > min_rss_mb)
+            measurement['baseline_seconds'] = base['seconds']
+            measurement['baseline_peak_rss_growth_mb'] = base.get('peak_rss_growth_mb')
+            measurement['status'] = 'REGRESSION' if slower or larger else 'ok'
+            if slower or larger:
+                regressions.append((size, measurement['stage']))
+    return regressions
+
+
+def print_table(results):
+    print(f"{'rows':>9} {'stage':<14} {'seconds':>9} {'rows/s':>12} {'peak RSS [MB]':>14} {'RSS growth [MB]':>16} {'baseline [s]':>13}  status")
+    for size, measurements in results.items():
+        for m in measurements:
+            rate = m['rows_per_second']
+            rate = '-' if not rate else f'{rate:,.0f}' if rate >= 100 else f'{rate:.2f}'
+            base = f"{m['baseline_seconds']:.3f}" if 'baseline_seconds' in m else '-'
+            print(f"{size:>9} {m['stage']:<14} {m['seconds']:>9.3f} {rate:>12} {m['peak_rss_mb']:>14.1f} "
+                  f"{m['peak_rss_growth_mb']:>16.1f} {base:>13}  {m['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every pipeline stage on synthetic EDH corpora and compare with stored baselines.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                        help='corpus sizes in rows, up to 10M (corpora are generated once in benchmarks/data/)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--matcher', choices=['trie', 'regex'], default='trie')
+    parser.add_argument('--workers', type=int, default=4, help='render processes')
+    parser.add_argument('--baselines', default=BASELINES_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline of its sizes')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown or increase of the per-stage RSS growth that counts as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='absolute slowdown below which a stage is never flagged (timer noise)')
+    parser.add_argument('--min-rss-mb', type=float, default=10,
+                        help='absolute increase of the RSS growth below which a stage is never flagged (allocator noise)')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    parser.add_argument('--report', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        measurements = run_stages(args.run_one, WORK_DIR, args.matcher, args.workers)
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(measurements, f)
+        return
+
+    results = {str(rows): run_size(rows, args.seed, args.matcher, args.workers) for rows in args.sizes}
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, 'r', encoding='utf-8') as f:
+            baselines = json.load(f)
+    regressions = compare(results, baselines, args.tolerance, args.min_seconds, args.min_rss_mb)
+    print_table(results)
+
+    with open(os.path.join(WORK_DIR, 'last_run.json'), 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        for size, measurements in results.items():
+            baselines[size] = [{key: m[key] for key in ['stage', 'seconds', 'rows', 'peak_rss_mb', 'peak_rss_growth_mb']} for m in measurements]
+        with open(args.baselines, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2)
+        print(f'baseline saved in {args.baselines}')
+
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(f'{stage} ({size} rows)' for size, stage in regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
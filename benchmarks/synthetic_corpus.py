@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import random
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from ingest import PAGAN
+from keyword_compiler import baseform_mapping, load_keywords
+
+# roughly the shares of the EDH epitaph search results
+RELIGIONS = [(None, 0.6), (PAGAN, 0.2), ('cult functions, Jewish/Christian', 0.12), ('Judaism / Christianity', 0.08)]
+COUNTRIES = {
+    'Italy': ['Roma', 'Latium et Campania', 'Venetia et Histria'],
+    'Vatican City State': ['Roma'],
+    'Croatia': ['Dalmatia'],
+    'Austria': ['Noricum', 'Pannonia superior'],
+    'Hungary': ['Pannonia inferior', 'Pannonia superior'],
+    'Germany': ['Germania superior', 'Raetia'],
+    'Serbia': ['Moesia superior'],
+    'Bulgaria': ['Moesia inferior', 'Thracia'],
+    'Romania': ['Dacia'],
+    'France': ['Gallia Narbonensis', 'Lugdunensis'],
+    'Spain': ['Hispania citerior', 'Baetica'],
+    'United Kingdom': ['Britannia'],
+    'Greece': ['Achaia', 'Macedonia'],
+    'Turkey': ['Asia', 'Galatia'],
+    'Tunisia': ['Africa proconsularis'],
+}
+FILLER = [
+    'Grabstein', 'Grabplatte', 'mit', 'Inschrift', 'und', 'Darstellung', 'eines', 'einer', 'im', 'Giebel', 'links',
+    'rechts', 'oben', 'unten', 'Rahmen', 'Feld', 'Relief', 'Bruchstück', 'erhalten', 'beschädigt', 'Zeile', 'Buchstaben',
+]
+SUFFIXES = ['', '', '', 'e', 'es', 'en', 'n', 's']
+
+
+def commentary(rng, keywords, irregular):
+    words = [rng.choice(FILLER) for _ in range(rng.randint(5, 40))]
+    # about half of the commentaries mention a motif, some of them in an irregular form ("Vögel", "Kantharoi")
+    if rng.random() < 0.5:
+        for _ in range(rng.randint(1, 4)):
+            if irregular and rng.random() < 0.1:
+                word = rng.choice(irregular)
+            else:
+                word = rng.choice(keywords) + rng.choice(SUFFIXES)
+            words.insert(rng.randrange(len(words) + 1), word)
+    return ' '.join(words) + '.'
+
+
+def record(index, rng, keywords, irregular):
+    religion = rng.choices([religion for religion, _ in RELIGIONS], weights=[weight for _, weight in RELIGIONS])[0]
+    country = rng.choice(list(COUNTRIES))
+    not_before = rng.randint(1, 650)
+    not_after = not_before + rng.choice([0, 24, 49, 99, 199])
+    item = {
+        'id': f'HD{index:07d}',
+        'commentary': commentary(rng, keywords, irregular) if rng.random() < 0.9 else rng.choice(['', None]),
+        'religion': religion,
+        'not_before': f'{not_before:04d}',
+        'not_after': f'{not_after:04d}',
+        'country': country,
+        'province': rng.choice(COUNTRIES[country]),
+        'transcription': 'D(is) M(anibus) ' * rng.randint(1, 5),
+        'findspot_ancient': rng.choice(['Aquincum', 'Salona', 'Carnuntum', 'Roma', None]),
+        'type_of_inscription': 'epitaph',
+    }
+    # dates are missing for some records, like in the EDH
+    if rng.random() < 0.05:
+        item['not_before'] = item['not_after'] = None
+    return item
+
+
+# write an EDH-shaped corpus as .jsonl (one record per line) or as a results.json envelope, row by row
+def generate(path, rows, seed=42, keywords_path=os.path.join(SRC_DIR, 'keywords.txt')):
+    rng = random.Random(seed)
+    keywords = load_keywords(keywords_path)
+    irregular = [surface for surface in baseform_mapping if surface not in keywords]
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for index in range(rows):
+                f.write(json.dumps(record(index, rng, keywords, irregular), ensure_ascii=False) + '\n')
+        else:
+            f.write(json.dumps({'total': rows, 'limit': rows, 'offset': 0})[:-1] + ', "items": [')
+            for index in range(rows):
+                f.write((',' if index else '') + json.dumps(record(index, rng, keywords, irregular), ensure_ascii=False))
+            f.write(']}')
+    os.replace(tmp_path, path)
+    return path
+
+
+# generated corpora are kept and reused per size and seed
+def corpus_path(rows, seed=42, root=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'), fmt='jsonl'):
+    return os.path.join(root, f'edh_synthetic_{rows}_{seed}.{fmt}')
+
+
+def ensure_corpus(rows, seed=42, fmt='jsonl'):
+    path = corpus_path(rows, seed, fmt=fmt)
+    if not os.path.exists(path):
+        print(f'generating {rows} synthetic records in {path}')
+        generate(path, rows, seed)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic EDH-shaped corpus for offline benchmarks.')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None,
+                        help='.jsonl or .json file (default: benchmarks/data/edh_synthetic_<rows>_<seed>.jsonl)')
+    args = parser.parse_args()
+
+    path = generate(args.output or corpus_path(args.rows, args.seed), args.rows, args.seed)
+    print(f'{args.rows} records written to {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import importlib
+import sys
+
+# importable pipeline API, e.g. for a scheduler or a long-running service:
+#   df = load_corpus('data/results.json')
+#   motif_matrix = match_motifs(df, lemmatizer='table')
+#   filtered_df, filtered_matrix = classify_christian(df, motif_matrix)
+#   save_filtered(filtered_df, filtered_matrix, 'data/filtered_data.arrow', 'arrow')
+#   render(aggregate('data/filtered_data.arrow'), 'graphs')
+#   dashboard(aggregate('data/filtered_data.arrow'), 'dashboard.html')
+# several corpora at once, see corpora.json: python api.py build
+# every stage imports what it needs when it runs, stanza, geopandas, seaborn and matplotlib are never loaded at import
+
+# the CLI stages and the scripts behind them
+SCRIPTS = {
+    'download': 'api_client',
+    'filter': 'keyword_filter_regex',
+    'filter-stanza': 'keyword_filter_stanza',
+    'analyze': 'keyword_analysis',
+    'export': 'filtered_io',
+    'serve': 'tagging_service',
+    'dashboard': 'dashboard',
+    'build': 'build_corpora',
+}
+
+# matcher, lemmatizer and keyword groups per configuration, built once per process
+taggers = {}
+
+
+# religion, country and province as categories and the dates as small ints, unless compact=False
+def load_corpus(path='data/results.json', chunk_size=50000, compact=True, memory=None):
+    from ingest import COLUMNS, load_corpus as read_corpus
+
+    return read_corpus(path, COLUMNS, chunk_size, compact=compact, memory=memory)
+
+
+def tagger(matcher='trie', lemmatizer='stanza', keywords_path='keywords.txt', groups_path='keyword_groups.txt'):
+    key = (matcher, lemmatizer, keywords_path, groups_path)
+    if key not in taggers:
+        from keyword_compiler import load_artifact
+        from keyword_filter_regex import build_lemmatizer, build_matcher
+
+        artifact = load_artifact(keywords_path, groups_path)
+        # the Stanza model itself is only loaded when a surface form is not in the lemma cache
+        lemmatizer_object, stanza_lemmatizer = build_lemmatizer(artifact, lemmatizer)
+        taggers[key] = {
+            'artifact': artifact,
+            'matcher': build_matcher(artifact, matcher),
+            'lemmatizer': lemmatizer_object,
+            'stanza_lemmatizer': stanza_lemmatizer,
+            'motif_to_group': artifact['motif_to_group'],
+        }
+    return taggers[key]
+
+
+# motif matrix (rows x motifs) for a corpus DataFrame or a list of commentaries, in input order.
+# The cache_lookup, tagging and cache_store stages go to the run report, if one is given.
+# A set passed as surfaces collects the matched surface forms of every row, the result cache is then only written
+def match_motifs(corpus, matcher='trie', lemmatizer='stanza', workers=1, chunk_size=1000, cache_path=None,
+                 keywords_path='keywords.txt', groups_path='keyword_groups.txt', cache_size=1000000, run=None, surfaces=None):
+    from instrumentation import RunReport
+    from keyword_filter_regex import tag_commentaries, tag_commentaries_parallel
+    from motif_matrix import MotifMatrix
+    from result_cache import MISS, ResultCache, keyword_fingerprint
+
+    run = run or RunReport('api')
+    state = tagger(matcher, lemmatizer, keywords_path, groups_path)
+    stanza_lemmatizer = state['stanza_lemmatizer']
+    if isinstance(corpus, list):
+        commentaries, ids = corpus, [None] * len(corpus)
+    else:
+        commentaries = corpus['commentary'].tolist()
+        ids = corpus['id'].tolist() if 'id' in corpus else [None] * len(corpus)
+
+    # rows whose commentary and relevant keywords did not change come from the result cache, if one is given
+    results = [MISS] * len(commentaries)
+    cache = None
+    if cache_path:
+        with run.stage('cache_lookup', rows_in=len(commentaries)) as stage:
+            cache = ResultCache(cache_path, max_entries=cache_size)
+            fingerprint = keyword_fingerprint(state['artifact']['fingerprint'], lemmatizer)
+            cache.register_fingerprint(fingerprint, state['artifact']['surfaces'])
+            # the surface forms of a row are only known after tagging it
+            if surfaces is None:
+                results = cache.lookup(ids, commentaries, fingerprint)
+            stage.update(cache.stats)
+
+    todo = [i for i, result in enumerate(results) if result is MISS]
+    todo_commentaries = [commentaries[i] for i in todo]
+    with run.stage('tagging', rows_in=len(todo)) as stage:
+        if workers > 1:
+            tagged, tagged_surfaces = tag_commentaries_parallel(todo_commentaries, state['artifact'], matcher, lemmatizer,
+                                                                stanza_lemmatizer, workers, chunk_size, stage)
+        else:
+            calls, cache_hits = stanza_lemmatizer.calls, stanza_lemmatizer.cache_hits
+            tagged, tagged_surfaces = tag_commentaries(todo_commentaries, state['matcher'], state['lemmatizer'], stage)
+            stage.count('stanza_calls', stanza_lemmatizer.calls - calls)
+            stage.count('lemma_cache_hits', stanza_lemmatizer.cache_hits - cache_hits)
+        for i, result in zip(todo, tagged):
+            results[i] = result
+        stage.count('surfaces', len(tagged_surfaces))
+        stage.rows_out = sum(1 for result in tagged if result)
+    if surfaces is not None:
+        surfaces |= tagged_surfaces
+
+    if cache is not None:
+        with run.stage('cache_store', rows_in=len(todo)) as stage:
+            cache.store([ids[i] for i in todo], todo_commentaries, tagged, fingerprint)
+            cache.evict()
+            stage.count('evicted', cache.stats['evicted'])
+            print(cache.report())
+            cache.close()
+    if stanza_lemmatizer.cache:
+        stanza_lemmatizer.save()
+
+    return MotifMatrix.from_rows(results, state['motif_to_group'])
+
+
+# keep the rows with motifs and add the christian flag, returns the filtered rows and their motif matrix
+def classify_christian(df, motif_matrix):
+    from keyword_filter_regex import add_christian_column
+
+    has_motifs = motif_matrix.has_motifs()
+    filtered_matrix = motif_matrix.take(has_motifs)
+    return add_christian_column(df[has_motifs], filtered_matrix), filtered_matrix
+
+
+def save_filtered(filtered_df, motif_matrix, path=None, fmt='json', pretty=False):
+    from filtered_io import default_path, save_filtered_data
+
+    path = path or default_path(fmt)
+    save_filtered_data(filtered_df, motif_matrix, path, fmt, pretty=pretty)
+    return path
+
+
+# motif count cube of the filtered data, persisted and only rebuilt when the data or the binning changed
+def aggregate(path='data/filtered_data.json', bin_width=50, weighting='midpoint', chunk_size=100000, years=(200, 650)):
+    from motif_cube import load_cube
+
+    return load_cube(path, bin_width=bin_width, weighting=weighting, chunk_size=chunk_size, years=years)
+
+
+# build the figures from the cube and render them headless into render_dir, or show them
+def render(cube, render_dir=None, workers=4, country_index_path=None):
+    from country_index import COUNTRY_INDEX_PATH
+    from keyword_analysis import build_figures, render_all
+
+    figures = build_figures(cube, country_index_path or COUNTRY_INDEX_PATH)
+    if render_dir:
+        return render_all(figures, render_dir, workers)
+    for name, function, kwargs in figures:
+        function(**kwargs)
+    return {'rendered': len(figures), 'skipped': 0}
+
+
+# pre-aggregated JSON tiles of the cube and the interactive HTML dashboard on top of them
+def dashboard(cube, output='../results/dashboard.html', tiles_path='data/dashboard_tiles.json', inline_plotlyjs=False):
+    from dashboard import build_tiles, render_dashboard, save_tiles
+    from keyword_compiler import load_artifact
+
+    tiles = build_tiles(cube, load_artifact()['motif_to_group'])
+    save_tiles(tiles, tiles_path)
+    return render_dashboard(tiles, output, inline_plotlyjs)
+
+
+# one entry point for all stages, only the modules of the chosen stage are imported
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        description='Run one stage of the EDH motif pipeline, the remaining arguments go to the stage.',
+        epilog='stages: ' + ', '.join(f'{stage} ({script}.py)' for stage, script in SCRIPTS.items()),
+    )
+    parser.add_argument('stage', choices=list(SCRIPTS))
+    parser.add_argument('stage_args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    script = SCRIPTS[args.stage]
+    sys.argv = [f'{script}.py'] + args.stage_args
+    importlib.import_module(script).main()
+
+
+if __name__ == '__main__':
+    main()
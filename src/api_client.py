@@ -1,38 +1,207 @@
-import requests
+import argparse
+import datetime
+import hashlib
 import json
-import pandas as pd
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from edh_store import STORE_PATH, RecordStore
+from instrumentation import add_report_arguments, report_from_args
 
 
 base_url = "https://edh.ub.uni-heidelberg.de/data/api/inschrift/suche"
 
+## Roman provinces whose dataset of roman inscriptions is complete:
+provinces = ["Ach", "AlG", "AlP", "AlC", "AlM", "Bri", "Dac", "Dal", "Epi", "Gel", "GeS", "Mak", "Mol", "MoS", "Nor", "Pal", "PaS", "Rae", "Thr"]
+# province names of the records for the province codes of the search
+province_labels = {
+    "Ach": "Achaia", "AlG": "Alpes Graiae", "AlP": "Alpes Poeninae", "AlC": "Alpes Cottiae", "AlM": "Alpes Maritimae",
+    "Bri": "Britannia", "Dac": "Dacia", "Dal": "Dalmatia", "Epi": "Epirus", "Gel": "Germania inferior",
+    "GeS": "Germania superior", "Mak": "Macedonia", "Mol": "Moesia inferior", "MoS": "Moesia superior", "Nor": "Noricum",
+    "Pal": "Pannonia inferior", "PaS": "Pannonia superior", "Rae": "Raetia", "Thr": "Thracia",
+}
+
 params = {
-    ## Roman provinces whose dataset of roman inscriptions is complete:
-    # "provinz": ["Ach", "AlG", "AlP", "AlC", "AlM", "Bri", "Dac", "Dal", "Epi", "Gel", "GeS", "Mak", "Mol", "MoS", "Nor", "Pal", "PaS", "Rae", "Thr"],
     "inschriftgattung": "titsep",  # value for type of inscription: epitaph
     "jahr_a": "200", # earliest possible timeframe for christian monuments
-    "jahr_b": "600", # 
-    "limit": 1000000
+    "jahr_b": "600", #
 }
 
 
-response = requests.get(base_url, params=params)
+# session with a bounded connection pool, shared by all download threads
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# fetch one page, retrying with exponential backoff on connection errors, 429 and 5xx
+def fetch_page(session, url, query, offset, page_size, retries=5, backoff=1.0, timeout=60, stage=None):
+    page_params = {**query, "limit": page_size, "offset": offset}
+    for attempt in range(retries):
+        try:
+            response = session.get(url, params=page_params, timeout=timeout)
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+            print(f"oh no: {response.status_code} for offset {offset}, retrying")
+        except (requests.ConnectionError, requests.Timeout) as error:
+            print(f"oh no: {error} for offset {offset}, retrying")
+        if stage is not None:
+            stage.count("retries")
+        time.sleep(backoff * 2 ** attempt)
+    raise RuntimeError(f"giving up on offset {offset} after {retries} attempts")
+
+
+# each query gets its own checkpoint directory, so different queries never mix pages
+def checkpoint_dir_for(query, checkpoint_root):
+    key = hashlib.sha256(json.dumps(query, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(checkpoint_root, key)
+
+
+def page_path(checkpoint_dir, offset):
+    return os.path.join(checkpoint_dir, f"page_{offset:09d}.json")
+
+
+def save_page(checkpoint_dir, offset, page):
+    path = page_path(checkpoint_dir, offset)
+    # write to a temporary file first, an interrupted write never looks like a finished page
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(page, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
 
-if response.status_code == 200:
+
+def load_page(checkpoint_dir, offset):
+    path = page_path(checkpoint_dir, offset)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# download all pages of one query, pages checkpointed by an interrupted run are skipped
+# page and retry counts go to the run report stage, if one is given
+def download(query, url=base_url, checkpoint_root="data/pages", page_size=1000, workers=8, session=None, stage=None):
+    checkpoint_dir = checkpoint_dir_for(query, checkpoint_root)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    session = session or make_session(workers)
+
+    # the first page tells us how many results there are
+    first_page = load_page(checkpoint_dir, 0)
+    resumed = first_page is not None
+    if first_page is None:
+        first_page = fetch_page(session, url, query, 0, page_size, stage=stage)
+        save_page(checkpoint_dir, 0, first_page)
+
+    total = first_page.get("total", len(first_page["items"]))
+    offsets = list(range(0, total, page_size)) or [0]
+    missing = [offset for offset in offsets if not os.path.exists(page_path(checkpoint_dir, offset))]
+    if len(missing) < len(offsets) - 1:
+        print(f"resuming: {len(offsets) - len(missing)} of {len(offsets)} pages already downloaded")
+    if stage is not None:
+        stage.count("pages_downloaded", len(missing) + (not resumed))
+        stage.count("pages_from_checkpoint", len(offsets) - len(missing) - (not resumed))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetch_page, session, url, query, offset, page_size, stage=stage): offset
+            for offset in missing
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            offset = futures[future]
+            save_page(checkpoint_dir, offset, future.result())
+            print(f"page {offset // page_size + 1}/{len(offsets)} saved ({done}/{len(missing)})")
+
+    # merge the pages in offset order
+    items = []
+    for offset in offsets:
+        items.extend(load_page(checkpoint_dir, offset)["items"])
+    # the checkpoints only bridge interrupted downloads, the next run fetches the current data again
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    return items
+
+
+# fan out one query per province and merge the results, records are deduplicated by id
+def download_provinces(query, province_list, **kwargs):
+    items = []
+    seen = set()
+    for province in province_list:
+        print(f"downloading province {province}")
+        for item in download({**query, "provinz": province}, **kwargs):
+            if item.get("id") not in seen:
+                seen.add(item.get("id"))
+                items.append(item)
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download epitaphs from the EDH API.")
+    parser.add_argument("--url", default=base_url, help="API endpoint, e.g. a local stub server for offline runs")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8, help="number of concurrent page downloads")
+    parser.add_argument("--checkpoint-dir", default="data/pages", help="directory for downloaded pages")
+    parser.add_argument("--provinces", nargs="*", default=None,
+                        help="download per province; without values the complete provinces are used")
+    parser.add_argument("--output", default="data/results.json", help="use a .jsonl file for line-delimited output")
+    parser.add_argument("--sync", action="store_true",
+                        help="update the local record store and only report added, changed and removed inscriptions")
+    parser.add_argument("--store", default=STORE_PATH, help="local record store used by --sync")
+    parser.add_argument("--sync-report", default="data/sync_report.json")
+    add_report_arguments(parser, ["download", "sync", "save"])
+    args = parser.parse_args()
+    run = report_from_args("api_client", args)
+
+    # a sync always needs fresh pages, an interrupted sync resumes on the same day
+    checkpoint_root = args.checkpoint_dir
+    if args.sync:
+        checkpoint_root = os.path.join(args.checkpoint_dir, f"sync-{datetime.date.today().isoformat()}")
+
+    session = make_session(args.workers)
+    with run.stage("download") as stage:
+        options = dict(url=args.url, checkpoint_root=checkpoint_root, page_size=args.page_size,
+                       workers=args.workers, session=session, stage=stage)
+        if args.provinces is not None:
+            items = download_provinces(params, args.provinces or provinces, **options)
+        else:
+            items = download(params, **options)
+        stage.rows_out = len(items)
     print("choo choo, you got a response")
-    data = response.json()
 
-    # print(json.dumps(data, indent=2, ensure_ascii=False))
+    if args.sync:
+        with run.stage("sync", rows_in=len(items)) as stage:
+            store = RecordStore(args.store)
+            report = store.sync(items)
+            items = store.items()
+            store.close()
+            shutil.rmtree(checkpoint_root, ignore_errors=True)
+            stage.rows_out = len(items)
+            stage.update({kind: len(ids) for kind, ids in report.items()})
+
+        # the filter can use this report to reprocess only the affected rows
+        with open(args.sync_report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"{len(report['added'])} added, {len(report['changed'])} changed, {len(report['removed'])} removed "
+              f"(report in {args.sync_report})")
 
-    # Save to a JSON file
-    with open("data/results.json", "w", encoding="utf-8") as json_file:
-        json.dump(data, json_file, indent=2, ensure_ascii=False)
-    print("Data saved in data/results.json successfully")
+    # Save to a JSON file, or one record per line for .jsonl outputs
+    with run.stage("save", rows_in=len(items)):
+        with open(args.output, "w", encoding="utf-8") as json_file:
+            if args.output.endswith(".jsonl"):
+                for item in items:
+                    json_file.write(json.dumps(item, ensure_ascii=False) + "\n")
+            else:
+                json.dump({"total": len(items), "items": items}, json_file, indent=2, ensure_ascii=False)
+    print(f"Data saved in {args.output} successfully")
+    run.save()
 
-    # save as csv file
-    # df = pd.DataFrame(data)
-    # df.to_csv("data/results.csv", index=False, encoding="utf-8")
-    # print("data saved in data/results.csv sucessfully")
 
-else:
-    print(f"oh no: {response.status_code}")
-    print(response.text)  
+if __name__ == "__main__":
+    main()
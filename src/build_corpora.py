@@ -0,0 +1,275 @@
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import api
+from api_client import base_url, make_session, province_labels
+from chronology import BIN_WIDTHS, END, START
+from filtered_io import EXTENSIONS
+from instrumentation import add_report_arguments, report_from_args
+from motif_cube import BIN_WIDTH, WEIGHTINGS
+from result_cache import RESULT_CACHE_PATH
+
+MANIFEST_PATH = 'corpora.json'
+# every corpus gets its own directory below this one, the deduplicated records of all corpora are next to them
+OUTPUT_DIR = 'data/corpora'
+RECORDS_FILE = 'records.jsonl'
+
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+
+# named query configurations: {"corpora": [{"name", "query", "provinces", "bin_width", "weighting", "years"}, ...]}
+def load_manifest(path=MANIFEST_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f).get('corpora', [])
+
+    corpora = []
+    names = set()
+    for number, entry in enumerate(entries, start=1):
+        name = entry.get('name')
+        if not isinstance(name, str) or not NAME_PATTERN.match(name):
+            raise ValueError(f'{path}: corpus {number} needs a name of letters, digits, ".", "_" and "-", got {name!r}')
+        if name in names:
+            raise ValueError(f'{path}: corpus {name!r} is defined twice')
+        names.add(name)
+        query = entry.get('query')
+        if not isinstance(query, dict) or not query:
+            raise ValueError(f'{path}: corpus {name!r} needs a query with the EDH search parameters')
+        provinces = entry.get('provinces')
+        if provinces is not None and (not isinstance(provinces, list) or not provinces):
+            raise ValueError(f'{path}: provinces of corpus {name!r} must be a non-empty list')
+        bin_width = entry.get('bin_width', BIN_WIDTH)
+        if bin_width not in BIN_WIDTHS:
+            raise ValueError(f'{path}: bin_width of corpus {name!r} must be {BIN_WIDTHS[0]} to {BIN_WIDTHS[-1]} years, got {bin_width!r}')
+        weighting = entry.get('weighting', 'midpoint')
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f'{path}: weighting of corpus {name!r} must be one of {", ".join(WEIGHTINGS)}, got {weighting!r}')
+        # the bins cover the date window of the query, unless the corpus sets them
+        years = entry.get('years', default_years(query))
+        if len(years) != 2 or not all(isinstance(year, int) for year in years) or years[0] >= years[1]:
+            raise ValueError(f'{path}: years of corpus {name!r} must be [start, end], got {years!r}')
+        corpora.append({
+            'name': name,
+            'description': entry.get('description', ''),
+            'query': {key: str(value) for key, value in query.items()},
+            'provinces': provinces,
+            'bin_width': bin_width,
+            'weighting': weighting,
+            'years': tuple(years),
+        })
+    return corpora
+
+
+# the study range, or the date window of the query when it reaches beyond it
+def default_years(query):
+    try:
+        start, end = int(query['jahr_a']), int(query['jahr_b'])
+    except (KeyError, ValueError):
+        return [START, END]
+    if START <= start and end <= END:
+        return [START, END]
+    return [start, end]
+
+
+# the queries sent to the API for a corpus, one per province if it is restricted to provinces
+def fetch_units(corpus):
+    if corpus['provinces'] is None:
+        return [corpus['query']]
+    return [{**corpus['query'], 'provinz': province} for province in corpus['provinces']]
+
+
+def unit_key(query):
+    return json.dumps(query, sort_keys=True)
+
+
+# key of the query without the province, if that query is downloaded anyway and the province is known by name
+def superset_key(query, keys):
+    if query.get('provinz') not in province_labels:
+        return None
+    key = unit_key({name: value for name, value in query.items() if name != 'provinz'})
+    return key if key in keys else None
+
+
+def in_province(item, province):
+    return item.get('province') in (province, province_labels[province])
+
+
+# download every distinct query once, a few at a time, and deduplicate the records of all corpora by id.
+# A province slice of a query that is downloaded as well is cut from its records, not downloaded again.
+# returns the records by id and the ids of every corpus in download order
+def download_corpora(corpora, url=base_url, checkpoint_root='data/pages', page_size=1000, workers=8, parallel=4, stage=None):
+    from api_client import download
+
+    units = {}
+    for corpus in corpora:
+        for query in fetch_units(corpus):
+            units.setdefault(unit_key(query), query)
+    slices = {key: superset_key(query, units) for key, query in units.items()}
+    slices = {key: whole for key, whole in slices.items() if whole is not None}
+    downloads = {key: query for key, query in units.items() if key not in slices}
+    if stage is not None:
+        stage.count('queries', sum(len(fetch_units(corpus)) for corpus in corpora))
+        stage.count('distinct_queries', len(units))
+        stage.count('sliced_queries', len(slices))
+
+    session = make_session(workers * parallel)
+    results = {}
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = {
+            executor.submit(download, query, url=url, checkpoint_root=checkpoint_root, page_size=page_size,
+                            workers=workers, session=session, stage=stage): key
+            for key, query in downloads.items()
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            print(f"query {futures[future]} done ({len(results[futures[future]])} records)")
+    for key, whole in slices.items():
+        province = units[key]['provinz']
+        results[key] = [item for item in results[whole] if in_province(item, province)]
+        print(f"query {key} cut from {whole} ({len(results[key])} records)")
+
+    records = {}
+    members = {}
+    for corpus in corpora:
+        ids = members[corpus['name']] = []
+        seen = set()
+        for query in fetch_units(corpus):
+            for item in results[unit_key(query)]:
+                if item.get('id') not in seen:
+                    seen.add(item.get('id'))
+                    ids.append(item.get('id'))
+                    records.setdefault(item.get('id'), item)
+    return records, members
+
+
+def write_records(items, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+def corpus_dir(corpus, output_dir=OUTPUT_DIR):
+    return os.path.join(output_dir, corpus['name'])
+
+
+# cube, figures and dashboard of one corpus, runs in a worker process
+# the corpora are built side by side, so each keeps its own cube and country index next to its data
+def build_corpus(corpus, directory, data_path, render=True, dashboard=True, render_workers=2):
+    from motif_cube import load_cube
+
+    cube = load_cube(data_path, os.path.join(directory, 'motif_cube.pkl'), corpus['bin_width'], corpus['weighting'],
+                     years=corpus['years'])
+    summary = {'name': corpus['name'], 'cube_rows': len(cube)}
+    if render:
+        summary.update(api.render(cube, os.path.join(directory, 'graphs'), render_workers,
+                                  os.path.join(directory, 'country_index.json')))
+    # an empty cube has no tiles to show
+    if dashboard and len(cube):
+        api.dashboard(cube, os.path.join(directory, 'dashboard.html'), os.path.join(directory, 'dashboard_tiles.json'))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download, filter and analyse every corpus of the manifest, each into its own directory.')
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help='corpus manifest (JSON)')
+    parser.add_argument('--corpora', nargs='*', default=None, help='only build these corpora of the manifest')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='one directory per corpus is created in here')
+    parser.add_argument('--url', default=base_url, help='API endpoint, e.g. a local stub server for offline runs')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=8, help='number of concurrent page downloads per query')
+    parser.add_argument('--checkpoint-dir', default='data/pages', help='directory for the pages of interrupted downloads')
+    parser.add_argument('--parallel', type=int, default=4,
+                        help='number of queries downloaded and corpora built at the same time')
+    parser.add_argument('--format', choices=list(EXTENSIONS), default='arrow', help='format of the filtered data of each corpus')
+    parser.add_argument('--lemmatizer', choices=['stanza', 'table'], default='stanza')
+    parser.add_argument('--matcher', choices=['trie', 'regex'], default='trie')
+    parser.add_argument('--tag-workers', type=int, default=1, help='number of tagging processes')
+    parser.add_argument('--cache', default=RESULT_CACHE_PATH, help='per-inscription result cache, shared with keyword_filter_regex.py')
+    parser.add_argument('--no-cache', action='store_true', help='tag every record and leave the result cache alone')
+    parser.add_argument('--no-render', action='store_true', help='skip the matplotlib figures')
+    parser.add_argument('--no-dashboard', action='store_true', help='skip the HTML dashboards')
+    add_report_arguments(parser, ['download', 'ingest', 'tagging', 'christian', 'save', 'corpora'])
+    args = parser.parse_args()
+    run = report_from_args('build_corpora', args)
+
+    try:
+        corpora = load_manifest(args.manifest)
+    except ValueError as error:
+        sys.exit(f'corpora: {error}')
+    if args.corpora:
+        unknown = sorted(set(args.corpora) - {corpus['name'] for corpus in corpora})
+        if unknown:
+            sys.exit(f"corpora: not in {args.manifest}: {', '.join(unknown)}")
+        corpora = [corpus for corpus in corpora if corpus['name'] in args.corpora]
+
+    # overlapping corpora share their queries and records, each is downloaded once
+    with run.stage('download') as stage:
+        records, members = download_corpora(corpora, args.url, args.checkpoint_dir, args.page_size,
+                                            args.workers, args.parallel, stage)
+        stage.rows_out = len(records)
+        stage.count('corpus_records', sum(len(ids) for ids in members.values()))
+    print(f"{len(records)} distinct records for {sum(len(ids) for ids in members.values())} corpus records")
+    records_path = os.path.join(args.output_dir, RECORDS_FILE)
+    write_records(records.values(), records_path)
+    for corpus in corpora:
+        write_records((records[record_id] for record_id in members[corpus['name']]),
+                      os.path.join(corpus_dir(corpus, args.output_dir), 'results.jsonl'))
+
+    # the records of all corpora are tagged together, each once
+    with run.stage('ingest') as stage:
+        df = api.load_corpus(records_path)
+        stage.rows_out = len(df)
+    with run.stage('tagging', rows_in=len(df)) as stage:
+        motif_matrix = api.match_motifs(df, args.matcher, args.lemmatizer, args.tag_workers,
+                                        cache_path=None if args.no_cache else args.cache)
+        stage.rows_out = int(motif_matrix.has_motifs().sum())
+    with run.stage('christian', rows_in=len(df)) as stage:
+        filtered_df, filtered_matrix = api.classify_christian(df, motif_matrix)
+        stage.rows_out = len(filtered_df)
+        stage.count('christian', int(filtered_df['christian'].sum()))
+
+    # every corpus gets its slice of the filtered data
+    data_paths = {}
+    with run.stage('save', rows_in=len(filtered_df)) as stage:
+        for corpus in corpora:
+            mask = filtered_df['id'].isin(members[corpus['name']]).to_numpy()
+            directory = corpus_dir(corpus, args.output_dir)
+            data_paths[corpus['name']] = api.save_filtered(
+                filtered_df[mask], filtered_matrix.take(mask),
+                os.path.join(directory, 'filtered_data' + EXTENSIONS[args.format]), args.format,
+            )
+            stage.count(corpus['name'], int(mask.sum()))
+            print(f"{corpus['name']}: {len(members[corpus['name']])} records, {int(mask.sum())} with motifs")
+
+    # cubes, figures and dashboards of the corpora side by side, a failing corpus does not stop the others
+    failed = []
+    with run.stage('corpora', rows_in=len(corpora)) as stage:
+        with ProcessPoolExecutor(max_workers=args.parallel) as executor:
+            futures = {
+                executor.submit(build_corpus, corpus, corpus_dir(corpus, args.output_dir), data_paths[corpus['name']],
+                                not args.no_render, not args.no_dashboard): corpus['name']
+                for corpus in corpora
+            }
+            for future in as_completed(futures):
+                try:
+                    summary = future.result()
+                except Exception as error:
+                    failed.append(futures[future])
+                    print(f"{futures[future]}: failed: {error!r}")
+                    continue
+                stage.count('rendered', summary.get('rendered', 0))
+                stage.count('skipped', summary.get('skipped', 0))
+                print(f"{summary['name']}: {summary['cube_rows']} cube rows in {os.path.abspath(os.path.dirname(data_paths[summary['name']]))}")
+        stage.rows_out = len(futures) - len(failed)
+        stage.count('failed', len(failed))
+    run.save()
+    if failed:
+        sys.exit(f"corpora: failed to build {', '.join(sorted(failed))}")
+
+
+if __name__ == '__main__':
+    main()
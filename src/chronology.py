@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# range of the analysis, every bin width splits it into bins starting at START
+START = 200
+END = 650
+BIN_WIDTHS = range(10, 101)
+
+# columns the chronology and the cube need from the filtered data
+CHUNK_COLUMNS = ['not_before', 'not_after', 'country', 'province', 'christian', 'motifs', 'motif_group']
+
+
+# bin edges from START, the last bin reaches END (50 years: 200, 250, ..., 650)
+def bin_edges(width=50, start=START, end=END):
+    if width not in BIN_WIDTHS:
+        raise ValueError(f'bin width must be between {BIN_WIDTHS[0]} and {BIN_WIDTHS[-1]} years, not {width}')
+    return np.arange(start, end + width, width)
+
+
+def bin_labels(edges):
+    return [f"{start} to {end - 1}" for start, end in zip(edges[:-1], edges[1:])]
+
+
+def date_ranges(df):
+    not_before = pd.to_numeric(df['not_before'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    not_after = pd.to_numeric(df['not_after'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    return not_before, not_after
+
+
+# (row, bin, weight) triples, bin -1 collects everything outside the bins and rows without dates.
+# 'midpoint' puts the whole row into the bin of (not_before + not_after) / 2, 'overlap' spreads it over
+# every bin its date range overlaps, in proportion to the overlapping years. The weights of a row add up to 1.
+def bin_weights(not_before, not_after, edges, mode='midpoint'):
+    rows = np.arange(len(not_before))
+    dated = ~(np.isnan(not_before) | np.isnan(not_after))
+
+    if mode == 'midpoint':
+        midpoint = (not_before + not_after) / 2
+        bins = np.full(len(rows), -1)
+        inside = dated & (midpoint >= edges[0]) & (midpoint < edges[-1])
+        bins[inside] = np.searchsorted(edges, midpoint[inside], side='right') - 1
+        return rows, bins, np.ones(len(rows))
+
+    if mode != 'overlap':
+        raise ValueError(f'unknown weighting: {mode}')
+
+    # both years count, "not_before 300, not_after 349" covers 50 years
+    low = np.minimum(not_before[dated], not_after[dated])
+    high = np.maximum(not_before[dated], not_after[dated]) + 1
+    length = high - low
+    dated_rows = rows[dated]
+
+    first = np.clip(np.searchsorted(edges, low, side='right') - 1, 0, len(edges) - 2)
+    last = np.clip(np.searchsorted(edges, high, side='left') - 1, 0, len(edges) - 2)
+    counts = np.maximum(last - first + 1, 0)
+
+    # one entry per (row, overlapped bin), built without a Python loop
+    pair_rows = np.repeat(np.arange(len(dated_rows)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_bins = first[pair_rows] + offsets
+    overlap = (np.minimum(high[pair_rows], edges[pair_bins + 1]) - np.maximum(low[pair_rows], edges[pair_bins])).clip(0)
+    weights = overlap / length[pair_rows]
+    keep = weights > 0
+
+    # the share outside the bins, and rows without dates, go to bin -1
+    outside = 1 - np.bincount(pair_rows[keep], weights=weights[keep], minlength=len(dated_rows))
+    undated = rows[~dated]
+    has_outside = outside > 1e-9
+    return (
+        np.concatenate([dated_rows[pair_rows[keep]], dated_rows[has_outside], undated]),
+        np.concatenate([pair_bins[keep], np.full(has_outside.sum(), -1), np.full(len(undated), -1)]),
+        np.concatenate([weights[keep], outside[has_outside], np.ones(len(undated))]),
+    )
+
+
+# the filtered data in DataFrame chunks with christian as yes/no, each with the (row, name) pairs of the motifs and
+# motif groups, or None for JSON, whose joined strings are split by motif_cube.
+# Parquet and Arrow files are read batch by batch and the list columns are never converted row by row, JSON has to be loaded at once
+def iter_filtered_chunks(path, chunk_size=100000):
+    if path.endswith('.json'):
+        from filtered_io import load_filtered_data
+
+        df = load_filtered_data(path)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size], None
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from filtered_io import arrow_facet
+
+    # only the columns the cube needs are read
+    if path.endswith('.arrow'):
+        reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+        columns = [column for column in CHUNK_COLUMNS if column in reader.schema.names]
+        batches = (reader.get_batch(i).select(columns) for i in range(reader.num_record_batches))
+    else:
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        columns = [column for column in CHUNK_COLUMNS if column in parquet_file.schema_arrow.names]
+        batches = parquet_file.iter_batches(batch_size=chunk_size, columns=columns)
+
+    for batch in batches:
+        # Arrow record batches can be larger than chunk_size, slices are not copied
+        for start in range(0, batch.num_rows, chunk_size):
+            chunk = batch.slice(start, chunk_size)
+            facets = {'motif': arrow_facet(chunk.column('motifs')), 'motif_group': arrow_facet(chunk.column('motif_group'))}
+            df = chunk.drop_columns(['motifs', 'motif_group']).to_pandas()
+            df['christian'] = df['christian'].map({True: 'yes', False: 'no'})
+            yield df, facets
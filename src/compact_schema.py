@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+# repetitive strings, stored once per value in a category dictionary
+CATEGORY_COLUMNS = ['religion', 'country', 'province']
+DATE_COLUMNS = ['not_before', 'not_after']
+
+
+def memory_mb(df):
+    return float(df.memory_usage(deep=True).sum()) / (1024 * 1024)
+
+
+def memory_report(before_mb, after_mb):
+    saved = 1 - after_mb / before_mb if before_mb else 0
+    return f'DataFrame memory: {before_mb:.1f} MB with object columns, {after_mb:.1f} MB compact ({saved:.0%} less)'
+
+
+# EDH years ("0301", "-0030") as nullable 16-bit ints, 32 bits if a year does not fit
+def compact_dates(series):
+    years = pd.to_numeric(series, errors='coerce')
+    limits = np.iinfo(np.int16)
+    if years.notna().any() and (years.min() < limits.min or years.max() > limits.max):
+        return years.astype('Int32')
+    return years.astype('Int16')
+
+
+def compact_frame(df):
+    compact = df.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in compact:
+            compact[column] = compact[column].astype('category')
+    for column in DATE_COLUMNS:
+        if column in compact:
+            compact[column] = compact_dates(compact[column])
+    return compact
+
+
+# concatenate compact chunks, the category dictionaries of the chunks are merged into one per column
+def concat_compact(chunks):
+    combined = {}
+    for column in chunks[0].columns:
+        parts = [chunk[column] for chunk in chunks]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            combined[column] = pd.api.types.union_categoricals(parts)
+        else:
+            combined[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(combined)
+
+
+# Arrow list column of dictionary codes straight from the CSR rows of a motif matrix, without per-row Python lists.
+# With the keyword list as dictionary a code is the position of the motif in it, names missing there are appended
+def coded_list_array(matrix, names, dictionary):
+    import pyarrow as pa
+
+    dictionary = list(dictionary) + sorted(set(names) - set(dictionary))
+    position = {name: i for i, name in enumerate(dictionary)}
+    codes = np.array([position[name] for name in names], dtype=np.int16 if len(dictionary) < 2 ** 15 else np.int32)
+
+    matrix = matrix.tocsr()
+    matrix.sort_indices()
+    values = pa.DictionaryArray.from_arrays(pa.array(codes[matrix.indices]), pa.array(dictionary, type=pa.string()))
+    return pa.ListArray.from_arrays(pa.array(matrix.indptr.astype(np.int32)), values)
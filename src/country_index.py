@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+COUNTRY_INDEX_PATH = 'data/cache/country_index.json'
+
+# EDH country names that are spelled differently in the Natural Earth ADMIN column
+COUNTRY_ALIASES = {
+    "Serbia": "Republic of Serbia",
+    "Macedonia": "North Macedonia",
+    "FYR Macedonia": "North Macedonia",
+    "Former Yugoslav Republic of Macedonia": "North Macedonia",
+    "Czech Republic": "Czechia",
+    "Bosnia-Herzegovina": "Bosnia and Herzegovina",
+    "Bosnia & Herzegovina": "Bosnia and Herzegovina",
+    "Great Britain": "United Kingdom",
+    "England": "United Kingdom",
+    "Scotland": "United Kingdom",
+    "Wales": "United Kingdom",
+    "Türkiye": "Turkey",
+    "Russian Federation": "Russia",
+    "Palestinian Territories": "Palestine",
+    # states too small for the 1:110m map are counted with the surrounding country
+    "Vatican City": "Italy",
+    "Vatican City State": "Italy",
+    "Holy See": "Italy",
+    "San Marino": "Italy",
+    "Monaco": "France",
+    "Andorra": "Spain",
+    "Liechtenstein": "Switzerland",
+}
+
+
+# hash of the alias table, an index built with other aliases is rebuilt
+def aliases_fingerprint(aliases=COUNTRY_ALIASES):
+    return hashlib.sha256(json.dumps(aliases, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+# geometry id (row of the world GeoDataFrame) for an EDH country name, -1 if there is none
+def match_country(country, geometry_ids):
+    name = COUNTRY_ALIASES.get(country, country)
+    if name in geometry_ids:
+        return geometry_ids[name]
+    return geometry_ids.get(str(name).casefold(), -1)
+
+
+# map the (country, province) pairs of the cube to integer geometry ids
+def build_country_index(pairs, world):
+    geometry_names = list(world['ADMIN'])
+    geometry_ids = {}
+    for geometry_id, name in enumerate(geometry_names):
+        geometry_ids[name] = geometry_id
+        geometry_ids.setdefault(name.casefold(), geometry_id)
+
+    countries = {country: match_country(country, geometry_ids) for country in pairs['country'].dropna().unique()}
+
+    # every province gets its own id and the geometry of the country most of its finds come from
+    provinces = {}
+    province_pairs = pairs.dropna(subset=['province', 'country'])
+    for province_id, (province, rows) in enumerate(province_pairs.groupby('province', sort=True)):
+        main_country = rows.groupby('country')['count'].sum().idxmax()
+        provinces[province] = {'id': province_id, 'geometry_id': countries[main_country]}
+
+    return {
+        'aliases': aliases_fingerprint(),
+        'geometry_names': geometry_names,
+        'countries': countries,
+        'provinces': provinces,
+        'unmatched': sorted(country for country, geometry_id in countries.items() if geometry_id < 0),
+    }
+
+
+# load the persisted index, it is rebuilt when the aliases, the geometries or the set of countries/provinces change
+def load_country_index(cube, world, index_path=COUNTRY_INDEX_PATH):
+    motifs = cube[cube['kind'] == 'motif']
+    pairs = motifs.groupby(['country', 'province'], dropna=False)['count'].sum().reset_index()
+
+    index = None
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if (index.get('aliases') != aliases_fingerprint()
+                or index['geometry_names'] != list(world['ADMIN'])
+                or not set(pairs['country'].dropna()) <= set(index['countries'])
+                or not set(pairs['province'].dropna()) <= set(index['provinces'])):
+            index = None
+
+    if index is None:
+        index = build_country_index(pairs, world)
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        # written under another name first, a parallel reader never sees a half-written index
+        temporary_path = f'{index_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, index_path)
+
+    if index['unmatched']:
+        print(f"Countries without a map geometry: {', '.join(index['unmatched'])}")
+    return index
+
+
+def country_geometry_ids(countries, index):
+    return np.array([index['countries'].get(country, -1) for country in countries], dtype=np.int64)
+
+
+# sum counts indexed by country into one value per geometry
+def sum_by_geometry(counts, index):
+    size = len(index['geometry_names'])
+    geometry_ids = country_geometry_ids(counts.index, index)
+    matched = geometry_ids >= 0
+    totals = np.bincount(geometry_ids[matched], weights=counts.values[matched], minlength=size)
+    # geometries without finds stay empty for plotting
+    return pd.Series(np.where(totals > 0, totals, np.nan))
+
+
+# most common item per geometry from counts indexed by (country, item), ties go to the first item alphabetically
+def most_common_by_geometry(counts, index):
+    size = len(index['geometry_names'])
+    geometry_ids = country_geometry_ids(counts.index.get_level_values(0), index)
+    item_codes, items = pd.factorize(counts.index.get_level_values(1), sort=True)
+    matched = geometry_ids >= 0
+
+    matrix = np.zeros((size, len(items)))
+    np.add.at(matrix, (geometry_ids[matched], item_codes[matched]), counts.values[matched])
+
+    best = pd.Series(np.asarray(items, dtype=object)[matrix.argmax(axis=1)] if len(items) else [None] * size)
+    return best.where(matrix.sum(axis=1) > 0, None)
@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+
+from chronology import BIN_WIDTHS
+from instrumentation import add_report_arguments, report_from_args
+from motif_cube import BIN_WIDTH, WEIGHTINGS, cube_bin_labels, load_cube
+
+TILES_PATH = 'data/dashboard_tiles.json'
+DASHBOARD_PATH = '../results/dashboard.html'
+# bump when the layout of the tiles changes
+TILES_VERSION = 1
+
+UNKNOWN = '(unknown)'
+
+# the dashboard dimensions, province and era are summed out of the cube
+TILE_DIMENSIONS = ['item', 'date_bin', 'country', 'christian']
+
+
+# small pre-aggregated tiles of the cube: one table per facet, every dimension as codes into a shared list of names.
+# The browser filters and sums these tables, it never sees the rows of the filtered data
+def build_tiles(cube, motif_to_group):
+    bin_width = cube.attrs.get('bin_width', BIN_WIDTH)
+    bins = cube_bin_labels(cube)
+    summed = (cube.fillna({'country': UNKNOWN})
+              .groupby(['kind'] + TILE_DIMENSIONS, dropna=False)['count'].sum().reset_index())
+    summed = summed[summed['count'] > 0]
+
+    names = {
+        'motif': sorted(summed.loc[summed['kind'] == 'motif', 'item'].unique()),
+        'motif_group': sorted(summed.loc[summed['kind'] == 'motif_group', 'item'].unique()),
+    }
+    countries = sorted(summed['country'].unique())
+    bin_codes = {label: i for i, label in enumerate(bins)}
+    country_codes = {country: i for i, country in enumerate(countries)}
+    group_codes = {group: i for i, group in enumerate(names['motif_group'])}
+
+    tiles = {}
+    for kind, rows in summed.groupby('kind'):
+        item_codes = {item: i for i, item in enumerate(names[kind])}
+        tiles[kind] = {
+            'item': rows['item'].map(item_codes).tolist(),
+            # -1: undated or outside the time bins
+            'bin': [bin_codes.get(label, -1) for label in rows['date_bin']],
+            'country': rows['country'].map(country_codes).tolist(),
+            'christian': (rows['christian'] == 'yes').astype(int).tolist(),
+            # overlap weighting gives fractional counts
+            'count': [round(float(count), 3) for count in rows['count']],
+        }
+
+    return {
+        'version': TILES_VERSION,
+        'bin_width': bin_width,
+        'weighting': cube.attrs.get('weighting', 'midpoint'),
+        'bins': bins,
+        'countries': countries,
+        'motifs': names['motif'],
+        'groups': names['motif_group'],
+        # group code of every motif, -1 for motifs without a group
+        'motif_group': [group_codes.get(motif_to_group.get(motif), -1) for motif in names['motif']],
+        'tiles': tiles,
+    }
+
+
+def save_tiles(tiles, path=TILES_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(tiles, f, ensure_ascii=False, separators=(',', ':'))
+    return path
+
+
+# chart layouts from plotly, the data is filled in by the page
+def chart_layouts(bin_width):
+    import plotly.graph_objects as go
+
+    def layout(title, xaxis, yaxis, height, reversed_y=False):
+        return go.Layout(
+            title=title, xaxis=dict(title=xaxis), yaxis=dict(title=yaxis, autorange='reversed' if reversed_y else True),
+            template='plotly_white', height=height, margin=dict(l=160, r=20, t=50, b=60)
+        ).to_plotly_json()
+
+    # horizontal bars are listed from the top
+    return {
+        'motifs': layout('Top 25 Most Common Motifs', 'Frequency', 'Motifs', 650, reversed_y=True),
+        'groups': layout('Motif Groups', 'Frequency', 'Motif Groups', 450, reversed_y=True),
+        'trend': layout('Chronological Trends of Top 10 Motifs', f'{bin_width}-Year Time Bin', 'Frequency', 500),
+        'countries': layout('Finds by Country', 'Frequency', 'Country', 500, reversed_y=True),
+    }
+
+
+def plotlyjs_tag(inline=False):
+    if inline:
+        from plotly.offline import get_plotlyjs
+        return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    from plotly.offline import get_plotlyjs_version
+    return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js" charset="utf-8"></script>'
+
+
+# one self-contained HTML file: the tiles are embedded, so it opens from disk or as an e-mail attachment
+def render_dashboard(tiles, output=DASHBOARD_PATH, inline_plotlyjs=False):
+    # "</" must not end the script element early
+    data = json.dumps(tiles, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+    layouts = json.dumps(chart_layouts(tiles['bin_width']), ensure_ascii=False)
+    html = (PAGE.replace('__PLOTLYJS__', plotlyjs_tag(inline_plotlyjs))
+            .replace('__TILES__', data)
+            .replace('__LAYOUTS__', layouts))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(html)
+    return output
+
+
+PAGE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Figural motifs on early Christian epitaphs</title>
+__PLOTLYJS__
+<style>
+  body { font-family: sans-serif; margin: 0; display: flex; }
+  aside { width: 260px; padding: 16px; background: #f4f4f4; height: 100vh; overflow-y: auto; box-sizing: border-box; position: sticky; top: 0; }
+  aside label { display: block; margin-top: 12px; font-weight: bold; font-size: 13px; }
+  aside select { width: 100%; }
+  aside p { font-size: 12px; color: #555; }
+  main { flex: 1; padding: 8px 16px; }
+  main p.empty { margin-top: 40px; font-size: 18px; color: #555; }
+</style>
+</head>
+<body>
+<aside>
+  <h3>Filters</h3>
+  <label for="motifs">Motifs</label>
+  <select id="motifs" multiple size="8"></select>
+  <label for="groups">Motif groups</label>
+  <select id="groups" multiple size="8"></select>
+  <label for="christian">Christian</label>
+  <select id="christian"><option value="all">all</option><option value="1">yes</option><option value="0">no</option></select>
+  <label for="from">From</label>
+  <select id="from"></select>
+  <label for="to">To</label>
+  <select id="to"></select>
+  <label for="countries">Countries</label>
+  <select id="countries" multiple size="8"></select>
+  <p>Ctrl/Cmd-click selects several values, no selection means all.
+     The motif filter applies to the motif charts, undated finds only count when the whole time range is selected.</p>
+  <button id="reset">Reset</button>
+  <p id="info"></p>
+</aside>
+<main>
+  <div id="motifs-chart"></div>
+  <div id="trend-chart"></div>
+  <div id="groups-chart"></div>
+  <div id="countries-chart"></div>
+</main>
+<script>
+const TILES = __TILES__;
+const LAYOUTS = __LAYOUTS__;
+// an empty cube has no tiles, the motif groups are missing when no motif has a group
+const motifTile = TILES.tiles.motif, groupTile = TILES.tiles.motif_group;
+
+function fill(id, names) {
+  const select = document.getElementById(id);
+  names.forEach((name, i) => select.add(new Option(name, i)));
+}
+function selected(id) {
+  const values = Array.from(document.getElementById(id).selectedOptions, option => Number(option.value));
+  return values.length ? new Set(values) : null;
+}
+
+fill('motifs', TILES.motifs);
+fill('groups', TILES.groups);
+fill('from', TILES.bins);
+fill('to', TILES.bins);
+fill('countries', TILES.countries);
+document.getElementById('to').value = TILES.bins.length - 1;
+
+// sum the counts of one tile that pass the filters, by the given key function
+function sum(tile, keep, key, size) {
+  const totals = new Float64Array(size);
+  for (let i = 0; i < tile.count.length; i++) {
+    if (keep(tile, i)) totals[key(tile, i)] += tile.count[i];
+  }
+  return totals;
+}
+function top(totals, n) {
+  return Array.from(totals.keys()).filter(i => totals[i] > 0)
+    .sort((a, b) => totals[b] - totals[a]).slice(0, n);
+}
+
+function update() {
+  const motifs = selected('motifs'), groups = selected('groups'), countries = selected('countries');
+  const christian = document.getElementById('christian').value;
+  const from = Number(document.getElementById('from').value), to = Number(document.getElementById('to').value);
+  const wholeRange = from === 0 && to === TILES.bins.length - 1;
+
+  const common = (tile, i) =>
+    (christian === 'all' || tile.christian[i] === Number(christian))
+    && (countries === null || countries.has(tile.country[i]))
+    && (tile.bin[i] < 0 ? wholeRange : tile.bin[i] >= from && tile.bin[i] <= to);
+  const motifKeep = (tile, i) => common(tile, i)
+    && (motifs === null || motifs.has(tile.item[i]))
+    && (groups === null || groups.has(TILES.motif_group[tile.item[i]]));
+  const groupKeep = (tile, i) => common(tile, i) && (groups === null || groups.has(tile.item[i]));
+
+  const motifTotals = sum(motifTile, motifKeep, (t, i) => t.item[i], TILES.motifs.length);
+  const top25 = top(motifTotals, 25);
+  Plotly.react('motifs-chart', [{type: 'bar', orientation: 'h', x: top25.map(i => motifTotals[i]),
+    y: top25.map(i => TILES.motifs[i])}], LAYOUTS.motifs);
+
+  // one line per motif of the top 10 over the time bins
+  const top10 = top(motifTotals, 10);
+  const binned = sum(motifTile, (t, i) => motifKeep(t, i) && t.bin[i] >= 0,
+    (t, i) => t.item[i] * TILES.bins.length + t.bin[i], TILES.motifs.length * TILES.bins.length);
+  const bins = TILES.bins.slice(from, to + 1);
+  Plotly.react('trend-chart', top10.map(m => ({type: 'scatter', mode: 'lines+markers', name: TILES.motifs[m], x: bins,
+    y: bins.map((_, b) => binned[m * TILES.bins.length + from + b])})), LAYOUTS.trend);
+
+  if (groupTile) {
+    const groupTotals = sum(groupTile, groupKeep, (t, i) => t.item[i], TILES.groups.length);
+    const topGroups = top(groupTotals, TILES.groups.length);
+    Plotly.react('groups-chart', [{type: 'bar', orientation: 'h', x: topGroups.map(i => groupTotals[i]),
+      y: topGroups.map(i => TILES.groups[i])}], LAYOUTS.groups);
+  }
+
+  const countryTotals = sum(motifTile, motifKeep, (t, i) => t.country[i], TILES.countries.length);
+  const topCountries = top(countryTotals, TILES.countries.length);
+  Plotly.react('countries-chart', [{type: 'bar', orientation: 'h', x: topCountries.map(i => countryTotals[i]),
+    y: topCountries.map(i => TILES.countries[i])}], LAYOUTS.countries);
+
+  document.getElementById('info').textContent =
+    `${TILES.bin_width}-year bins, ${TILES.weighting} weighting, ${motifTile.count.length + (groupTile ? groupTile.count.length : 0)} tile rows`;
+}
+
+if (!motifTile) {
+  const message = document.createElement('p');
+  message.className = 'empty';
+  message.textContent = 'No finds with motifs in this dataset.';
+  document.querySelector('main').replaceChildren(message);
+  document.querySelectorAll('aside select, aside button').forEach(element => element.disabled = true);
+} else {
+  ['motifs', 'groups', 'christian', 'from', 'to', 'countries'].forEach(id =>
+    document.getElementById(id).addEventListener('change', update));
+  document.getElementById('reset').addEventListener('click', () => {
+    ['motifs', 'groups', 'countries'].forEach(id => Array.from(document.getElementById(id).options).forEach(o => o.selected = false));
+    document.getElementById('christian').value = 'all';
+    document.getElementById('from').value = 0;
+    document.getElementById('to').value = TILES.bins.length - 1;
+    update();
+  });
+  update();
+}
+</script>
+</body>
+</html>
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write an interactive HTML dashboard of the filtered epitaphs.')
+    parser.add_argument('--input', default='data/filtered_data.json',
+                        help='filtered data (.json, .parquet or memory-mapped .arrow)')
+    parser.add_argument('--output', default=DASHBOARD_PATH, help='HTML file')
+    parser.add_argument('--tiles', default=TILES_PATH, help='where the pre-aggregated tiles are saved as JSON')
+    parser.add_argument('--bin-width', type=int, choices=BIN_WIDTHS, default=BIN_WIDTH, metavar='YEARS',
+                        help=f'width of the chronological bins, {BIN_WIDTHS[0]} to {BIN_WIDTHS[-1]} years (default: {BIN_WIDTH})')
+    parser.add_argument('--weighting', choices=WEIGHTINGS, default='midpoint')
+    parser.add_argument('--inline-plotlyjs', action='store_true',
+                        help='embed plotly.js (about 4.5 MB) instead of loading it from the CDN, for offline use')
+    add_report_arguments(parser, ['cube', 'tiles', 'rendering'])
+    args = parser.parse_args()
+    run = report_from_args('dashboard', args)
+
+    from keyword_compiler import load_artifact
+
+    # the same cube as keyword_analysis.py, only rebuilt when the filtered data or the binning changed
+    with run.stage('cube') as stage:
+        cube = load_cube(args.input, bin_width=args.bin_width, weighting=args.weighting)
+        stage.rows_out = len(cube)
+    with run.stage('tiles', rows_in=len(cube)) as stage:
+        tiles = build_tiles(cube, load_artifact('keywords.txt', 'keyword_groups.txt')['motif_to_group'])
+        save_tiles(tiles, args.tiles)
+        tile_rows = sum(len(tile['count']) for tile in tiles['tiles'].values())
+        stage.rows_out = tile_rows
+    with run.stage('rendering', rows_in=tile_rows) as stage:
+        output = render_dashboard(tiles, args.output, args.inline_plotlyjs)
+        stage.count('html_bytes', os.path.getsize(output))
+    print(f'dashboard with {tile_rows} tile rows saved in {os.path.abspath(output)} '
+          f'({os.path.getsize(output) / 1024:.0f} KB)')
+    run.save()
+
+
+if __name__ == '__main__':
+    main()
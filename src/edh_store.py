@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+# local copy of the EDH records, keyed by inscription id
+STORE_PATH = 'data/edh_store.sqlite'
+
+
+# content hash of one record, independent of key order
+def record_hash(record):
+    return hashlib.sha256(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class RecordStore:
+
+    def __init__(self, path=STORE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, hash TEXT NOT NULL, record TEXT NOT NULL)'
+        )
+
+    def hashes(self):
+        return dict(self.connection.execute('SELECT id, hash FROM records'))
+
+    # bring the store in line with a freshly downloaded list of records and report what changed
+    def sync(self, items):
+        stored = self.hashes()
+        fetched = {}
+        for item in items:
+            fetched[item['id']] = item
+
+        added, changed = [], []
+        rows = []
+        for record_id, item in fetched.items():
+            item_hash = record_hash(item)
+            if record_id not in stored:
+                added.append(record_id)
+            elif stored[record_id] != item_hash:
+                changed.append(record_id)
+            else:
+                continue
+            rows.append((record_id, item_hash, json.dumps(item, ensure_ascii=False)))
+        removed = sorted(set(stored) - set(fetched))
+
+        # one transaction, an interrupted sync leaves the store untouched
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO records (id, hash, record) VALUES (?, ?, ?)', rows)
+            self.connection.executemany('DELETE FROM records WHERE id = ?', [(record_id,) for record_id in removed])
+
+        return {'added': sorted(added), 'changed': sorted(changed), 'removed': removed}
+
+    def items(self):
+        return [json.loads(record) for (record,) in self.connection.execute('SELECT record FROM records ORDER BY id')]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,132 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# file extension of each output format
+EXTENSIONS = {'json': '.json', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def default_path(fmt):
+    return 'data/filtered_data' + EXTENSIONS[fmt]
+
+
+# motifs and motif groups come from the motif matrix, they are only joined to strings for JSON
+def export_frame(filtered_df, motif_matrix):
+    exported = filtered_df.reset_index(drop=True)
+    christian = exported.pop('christian')
+    # christian stays "yes"/"no" in the JSON output
+    return exported.assign(
+        motifs=[', '.join(row) for row in motif_matrix.motif_lists()],
+        motif_group=[', '.join(row) for row in motif_matrix.group_lists()],
+        christian=christian.map({True: 'yes', False: 'no'}),
+    )
+
+
+# columnar table with category columns as Arrow dictionaries and the motifs as list columns of codes.
+# The motif dictionary is the keyword list, readers get the names from the dictionaries
+def export_table(filtered_df, motif_matrix, keywords):
+    import pyarrow as pa
+
+    from compact_schema import coded_list_array
+
+    exported = filtered_df.reset_index(drop=True)
+    christian = exported.pop('christian')
+    table = pa.Table.from_pandas(exported, preserve_index=False)
+    table = table.append_column('motifs', coded_list_array(motif_matrix.matrix, motif_matrix.motifs, keywords))
+    table = table.append_column('motif_group', coded_list_array(motif_matrix.group_membership(), motif_matrix.groups, motif_matrix.groups))
+    return table.append_column('christian', pa.array(christian.to_numpy(dtype=bool)))
+
+
+def save_filtered_data(filtered_df, motif_matrix, path, fmt='json', pretty=False, keywords=None):
+    if fmt == 'json':
+        exported = export_frame(filtered_df, motif_matrix)
+        # written once, pretty printing is an explicit choice
+        exported.to_json(path, orient='records', lines=False, force_ascii=False, indent=2 if pretty else None)
+    elif fmt in ('parquet', 'arrow'):
+        # the motif dictionary is the deduplicated keyword list of the keyword artifact
+        if keywords is None:
+            from keyword_compiler import load_artifact
+
+            keywords = load_artifact('keywords.txt', 'keyword_groups.txt')['keywords']
+        table = export_table(filtered_df, motif_matrix, keywords)
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, path)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(table, path)
+    else:
+        raise ValueError(f'unknown format: {fmt}')
+
+
+# (row, name) pairs of a motif/motif group list column, the rows count from 0 in every array.
+# The names are looked up in the dictionary of the column, no list is built per row
+def arrow_facet(column):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    rows, names, start = [], [], 0
+    for chunk in (column.chunks if isinstance(column, pa.ChunkedArray) else [column]):
+        values = pc.list_flatten(chunk)
+        if pa.types.is_dictionary(values.type):
+            names.append(values.dictionary.to_numpy(zero_copy_only=False)[values.indices.to_numpy(zero_copy_only=False)])
+        else:
+            names.append(values.to_numpy(zero_copy_only=False))
+        rows.append(pc.list_parent_indices(chunk).to_numpy(zero_copy_only=False) + start)
+        start += len(chunk)
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([], dtype=object)
+    return np.concatenate(rows), np.concatenate(names).astype(object)
+
+
+# (row, name) pairs of a ', '-joined column of the JSON output
+def string_facet(strings):
+    exploded = pd.Series(strings).reset_index(drop=True).str.split(', ').explode()
+    exploded = exploded[exploded.notna() & (exploded != '')]
+    return exploded.index.to_numpy(), exploded.to_numpy(dtype=object)
+
+
+# the motifs of a list column as ', '-joined strings, joined by Arrow
+def joined_strings(column):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    return pc.binary_join(column.cast(pa.list_(pa.string())), ', ')
+
+
+# load the filtered data as in the JSON output: motifs and motif groups as ', '-joined strings, christian as yes/no
+def load_filtered_data(path='data/filtered_data.json'):
+    if path.endswith('.json'):
+        return pd.read_json(path)
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if path.endswith('.arrow'):
+        # Arrow IPC files are memory-mapped, numeric columns are not copied
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    else:
+        table = pq.read_table(path, memory_map=True)
+    for name in ('motifs', 'motif_group'):
+        table = table.set_column(table.schema.get_field_index(name), name, joined_strings(table.column(name)))
+    df = table.to_pandas()
+    df['christian'] = df['christian'].map({True: 'yes', False: 'no'})
+    return df
+
+
+# explicit export of a columnar file to pretty-printed JSON
+def main():
+    parser = argparse.ArgumentParser(description='Export the filtered data to pretty-printed JSON.')
+    parser.add_argument('input', help='filtered data in .parquet or .arrow format')
+    parser.add_argument('output', nargs='?', default='data/filtered_data.json')
+    args = parser.parse_args()
+
+    df = load_filtered_data(args.input)
+    df.to_json(args.output, orient='records', lines=False, force_ascii=False, indent=2)
+    print(f'{len(df)} items exported to {os.path.abspath(args.output)}')
+
+
+if __name__ == '__main__':
+    main()
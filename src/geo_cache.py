@@ -0,0 +1,74 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+SHAPEFILE = 'mapdata/ne_110m_admin_0_countries.shp'
+WORLD_CACHE_PATH = 'data/cache/world.pkl'
+
+# extent of the Roman Mediterranean in degrees (min lon, min lat, max lon, max lat)
+ROMAN_EXTENT = (-12, 20, 48, 58)
+
+
+# fingerprint of the shapefile parts and the extent, the cache is rebuilt when they change
+def shapefile_fingerprint(shapefile=SHAPEFILE, extent=ROMAN_EXTENT):
+    digest = hashlib.sha256()
+    base = os.path.splitext(shapefile)[0]
+    for extension in ['.shp', '.shx', '.dbf', '.prj']:
+        if os.path.exists(base + extension):
+            with open(base + extension, 'rb') as f:
+                digest.update(f.read())
+    digest.update(repr(extent).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# boundary lines as plain coordinate arrays, ready for a LineCollection
+def boundary_segments(world):
+    segments = []
+    for boundary in world.boundary:
+        if boundary is None or boundary.is_empty:
+            continue
+        lines = boundary.geoms if hasattr(boundary, 'geoms') else [boundary]
+        segments.extend(np.asarray(line.coords)[:, :2] for line in lines)
+    return segments
+
+
+# parse the shapefile, keep only the names and geometries and clip them to the extent
+def build_world(shapefile=SHAPEFILE, extent=ROMAN_EXTENT):
+    # geopandas is only needed when the cache is rebuilt, unpickling the cache imports it by itself
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    world = gpd.read_file(shapefile)[['ADMIN', 'geometry']]
+    world = gpd.clip(world, box(*extent))
+    world = world[~world.geometry.is_empty].reset_index(drop=True)
+    return world, boundary_segments(world)
+
+
+# return (world, boundary segments), parsed once and then loaded from the cache
+def load_world(shapefile=SHAPEFILE, cache_path=WORLD_CACHE_PATH, extent=ROMAN_EXTENT):
+    fingerprint = shapefile_fingerprint(shapefile, extent)
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['fingerprint'] == fingerprint:
+            return cached['world'], cached['segments']
+
+    world, segments = build_world(shapefile, extent)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # render workers may build the cache at the same time, so write it atomically
+    temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as f:
+        pickle.dump({'fingerprint': fingerprint, 'world': world, 'segments': segments}, f)
+    os.replace(temporary_path, cache_path)
+    return world, segments
+
+
+# draw the cached country boundaries on top of the fills and zoom to the extent
+def add_base_layer(ax, segments, extent=ROMAN_EXTENT, color='k', linewidth=1):
+    from matplotlib.collections import LineCollection
+
+    ax.add_collection(LineCollection(segments, colors=color, linewidths=linewidth, zorder=3))
+    ax.set_xlim(extent[0], extent[2])
+    ax.set_ylim(extent[1], extent[3])
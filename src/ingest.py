@@ -0,0 +1,75 @@
+import json
+
+import pandas as pd
+
+from compact_schema import compact_frame, concat_compact, memory_mb
+
+PAGAN = "names of pagan deities; cult functions, pagan"
+
+# the only columns the filter and the analysis use
+COLUMNS = ['id', 'commentary', 'religion', 'not_before', 'not_after', 'country', 'province']
+
+
+# iterate the records of a results file without loading the whole JSON tree
+def iter_items(path):
+    # line-delimited files hold one record per line
+    if path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    try:
+        import ijson
+    except ImportError:
+        # without ijson the file has to be parsed in one go
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)['items']
+        return
+
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'items.item', use_float=True)
+
+
+# drop pagan items and items without commentary before anything is materialized
+def keep_record(record):
+    commentary = record.get('commentary')
+    return (
+        record.get('religion') != PAGAN
+        and isinstance(commentary, str)
+        and commentary.strip() != ''
+    )
+
+
+# yield DataFrames of at most chunk_size filtered and projected records
+def read_chunks(path, columns=COLUMNS, chunk_size=50000):
+    chunk = []
+    for record in iter_items(path):
+        if keep_record(record):
+            chunk.append(tuple(record.get(column) for column in columns))
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame.from_records(chunk, columns=columns)
+                chunk = []
+    if chunk:
+        yield pd.DataFrame.from_records(chunk, columns=columns)
+
+
+# with compact=True every chunk is converted to categories and small ints before the next one is read,
+# memory gets the size of the object columns and of the compact frame in MB
+def load_corpus(path='data/results.json', columns=COLUMNS, chunk_size=50000, compact=False, memory=None):
+    chunks = []
+    object_mb = 0
+    for chunk in read_chunks(path, columns, chunk_size):
+        if compact:
+            object_mb += memory_mb(chunk)
+            chunk = compact_frame(chunk)
+        chunks.append(chunk)
+    if chunks:
+        df = concat_compact(chunks) if compact else pd.concat(chunks, ignore_index=True)
+    else:
+        # no record passed the filter
+        df = pd.DataFrame(columns=columns)
+    if memory is not None:
+        memory.update(object_mb=object_mb if compact else memory_mb(df), compact_mb=memory_mb(df))
+    return df
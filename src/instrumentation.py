@@ -0,0 +1,144 @@
+import datetime
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+RUN_REPORT_DIR = 'data/run_reports'
+PROFILE_DIR = 'data/profiles'
+
+
+# peak resident set size of the process so far (ru_maxrss is in KB on Linux, in bytes on macOS)
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def default_report_path(name, root=RUN_REPORT_DIR):
+    return os.path.join(root, f"{name}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+
+
+# measurements of one stage, counters can be incremented from several threads
+class Stage:
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def count(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def update(self, counters):
+        for counter, value in counters.items():
+            self.count(counter, value)
+
+
+# wall/CPU time, rows and peak memory per stage of one run, written as a JSON run report
+class RunReport:
+
+    def __init__(self, name, path=None, profile_stage=None, profiler='cprofile', profile_dir=PROFILE_DIR):
+        self.name = name
+        self.path = path
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        stage = Stage(name, rows_in)
+        peak_before = peak_rss_mb()
+        profiler = self._start_profiler() if name == self.profile_stage else None
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+            record = {
+                'stage': stage.name,
+                'wall_seconds': round(wall, 4),
+                'cpu_seconds': round(cpu, 4),
+                'rows_in': stage.rows_in,
+                'rows_out': stage.rows_out,
+                'rows_per_second': round(stage.rows_in / wall, 1) if stage.rows_in and wall > 0 else None,
+                'peak_rss_mb': round(peak_rss_mb(), 1),
+                # how much this stage raised the peak of the process
+                'peak_rss_growth_mb': round(peak_rss_mb() - peak_before, 1),
+                'counters': dict(stage.counters),
+            }
+            if profiler is not None:
+                record['profile'] = self._stop_profiler(profiler, name)
+            self.stages.append(record)
+
+    def _start_profiler(self):
+        if self.profiler == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                print('pyinstrument is not installed, profiling with cProfile')
+                self.profiler = 'cprofile'
+            else:
+                profiler = Profiler()
+                profiler.start()
+                return profiler
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    # cProfile stats can be read with pstats or snakeviz, pyinstrument writes an HTML page
+    def _stop_profiler(self, profiler, name):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{self.name}-{name}")
+        if self.profiler == 'pyinstrument':
+            profiler.stop()
+            path += '.html'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+        else:
+            profiler.disable()
+            path += '.prof'
+            profiler.dump_stats(path)
+        print(f"profile of stage {name} saved in {path}")
+        return path
+
+    def as_dict(self):
+        return {
+            'run': self.name,
+            'started': self.started,
+            'argv': sys.argv,
+            'wall_seconds': round(time.perf_counter() - self.start, 4),
+            'cpu_seconds': round(time.process_time() - self.cpu_start, 4),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': self.stages,
+        }
+
+    def save(self, path=None):
+        path = path or self.path or default_report_path(self.name)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2, ensure_ascii=False)
+        print(f"run report saved in {path}")
+        return path
+
+
+# --run-report/--profile-stage/--profiler for the scripts
+def add_report_arguments(parser, stages):
+    parser.add_argument('--run-report', default=None,
+                        help=f'JSON run report with time, rows, memory and counters per stage (default: {RUN_REPORT_DIR}/<script>-<time>.json)')
+    parser.add_argument('--profile-stage', choices=stages, default=None, help='profile one stage')
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile')
+
+
+def report_from_args(name, args):
+    return RunReport(name, args.run_report, args.profile_stage, args.profiler)
@@ -1,206 +1,125 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import geopandas as gpd
-from matplotlib import colormaps
-from matplotlib.lines import Line2D
-from matplotlib.colors import BoundaryNorm
 
-# Load filtered dataset
-df = pd.read_json('data/filtered_data.json')
+from country_index import COUNTRY_INDEX_PATH, load_country_index, most_common_by_geometry, sum_by_geometry
+from geo_cache import add_base_layer, load_world
+from instrumentation import add_report_arguments, report_from_args
+from chronology import BIN_WIDTHS
+from motif_cube import BIN_WIDTH, WEIGHTINGS, cube_bin_labels, cube_counts, load_cube
 
-### --- MOST COMMON MOTIFS, MOTIF GROUPS AND CHRISTIAN MOTIFS --- ###
+# remembers the input hash of every rendered figure
+RENDER_MANIFEST = '.render_manifest.json'
+
+# seaborn, matplotlib and geopandas are only imported by the plotting functions, building the figure data does not need them
 
-# Split motifs into individual entries for analysis
-df['motif_list'] = df['motifs'].str.split(', ')
 
-# Flatten the motif list for easier counting
-all_motifs = pd.Series([m for sublist in df['motif_list'] for m in sublist])
+# show the figure, or save it when rendering headless
+def show_or_save(output=None):
+    import matplotlib.pyplot as plt
+
+    if output:
+        plt.savefig(output, dpi=150, bbox_inches='tight')
+        plt.close('all')
+    else:
+        plt.show()
 
-# Get counts of all motifs
-motif_counts = all_motifs.value_counts()
 
-# Do the same for motif-groups
-df['motif_group_list'] = df['motif_group'].str.split(', ')
-all_motif_groups = pd.Series([group for sublist in df['motif_group_list'] for group in sublist if group]) 
-motif_group_counts = all_motif_groups.value_counts()
-top_motif_groups = motif_group_counts.nlargest(10)
+### --- MOST COMMON MOTIFS, MOTIF GROUPS AND CHRISTIAN MOTIFS --- ###
+
+# Create barplot
+def create_barplot(data, title, xlabel, ylabel, figsize=(10, 6,), palette='viridis', output=None):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-# Create barplot 
-def create_barplot(data, title, xlabel, ylabel, figsize=(10, 6,), palette='viridis'):
     plt.figure(figsize=figsize)
     sns.barplot(y=data.index, x=data.values, palette=palette)
     plt.title(title)
     plt.xlabel(xlabel)
     plt.ylabel(ylabel)
     plt.tight_layout()
-    plt.show()
-
-create_barplot(motif_counts.head(25), 'Top 25 Most Common Motifs', 'Frequency', 'Motifs', figsize=(10, 12))
-create_barplot(top_motif_groups, 'Top 10 Most Common Motif Groups', 'Frequency', 'Motif Groups', figsize=(12, 12))
-print(top_motif_groups)
-
-# Create barplot for the most common motifs that are identified as christian 
-# Get count
-top_motifs = motif_counts.head(15).index  
-top_motif_counts_by_christian = df.explode('motif_list')
-top_motif_counts_by_christian = top_motif_counts_by_christian[top_motif_counts_by_christian['motif_list'].isin(top_motifs)]
-top_motif_counts = top_motif_counts_by_christian.groupby(['motif_list', 'christian']).size().unstack(fill_value=0)
+    show_or_save(output)
 
-# Reorder columns 
-top_motif_counts = top_motif_counts[['yes', 'no']] 
+# Create barplot for the most common motifs that are identified as christian
+def create_christian_barplot(top_motif_counts_yes, output=None):
+    import matplotlib.pyplot as plt
 
-# Filter and sort motifs with a "christian: yes" status
-top_motif_counts_yes = top_motif_counts[top_motif_counts['yes'] > 0]  
-top_motif_counts_yes = top_motif_counts_yes.sort_values('yes', ascending=True)
+    colors = ['#bcbd22', '#9467bd']
+    top_motif_counts_yes.plot(kind='barh', stacked=True, figsize=(10, 12), color=colors)
 
-# Create bar plot 
-colors = ['#bcbd22', '#9467bd'] 
-top_motif_counts_yes.plot(kind='barh', stacked=True, figsize=(10, 12), color=colors)
-
-plt.title('Most common Motifs on proven Christian Epitaphs')
-plt.xlabel('Frequency')  
-plt.ylabel('Motifs')     
-plt.legend(title='christian')
-plt.tight_layout()
-plt.show()
+    plt.title('Most common Motifs on proven Christian Epitaphs')
+    plt.xlabel('Frequency')
+    plt.ylabel('Motifs')
+    plt.legend(title='christian')
+    plt.tight_layout()
+    show_or_save(output)
 
 
 ### --- CHRONOLOGICAL TRENDS --- ###
 
-# Convert 'not_before' and 'not_after' to integers
-df['not_before'] = pd.to_numeric(df['not_before'], errors='coerce')
-df['not_after'] = pd.to_numeric(df['not_after'], errors='coerce')
-
-# Average date (approximation for trends)
-df['average_date'] = (df['not_before'] + df['not_after']) / 2
-
-# Group motifs by time range
-chronological_data = (
-    df.explode('motif_list')
-    .groupby(['average_date', 'motif_list'])
-    .size()
-    .unstack(fill_value=0)
-)
-
-# Create 50-year bins 
-bins = list(range(200, 700, 50))  # Example range: 500 BCE to 500 CE
-labels = [f"{start} to {start + 49}" for start in bins[:-1]]
-
-# Add a 'date_bin' column to the DataFrame
-df['date_bin'] = pd.cut(
-    df['average_date'], 
-    bins=bins, 
-    labels=labels, 
-    right=False  
-)
-
-# Group motifs by date_bin
-binned_data = (
-    df.explode('motif_list')
-    .groupby(['date_bin', 'motif_list'])
-    .size()
-    .unstack(fill_value=0)
-)
-
-# Group motif groups by time range
-binned_group_data = (
-    df.explode('motif_group_list')
-    .groupby(['date_bin', 'motif_group_list'])
-    .size()
-    .unstack(fill_value=0)
-)
-# print(binned_group_data)
-# print(motif_group_counts) 
-print(top_motif_groups) 
-
-# calculate frequency of each motif and select the top 25 and top 10
-top_25_motifs = binned_data.sum(axis=0).nlargest(25).index
-top_10_motifs = binned_data.sum(axis=0).nlargest(10).index
-binned_data_top_25 = binned_data[top_25_motifs]
-binned_data_top_10 = binned_data[top_10_motifs]
-# ubset binned_group_data for the global top 10 motif groups
-binned_group_data_top_10 = binned_group_data[top_motif_groups.index]
-
 # create Line Plot
-def create_lineplot(data, title, xlabel, ylabel, figsize=(14, 8), linewidth=2, legend_title='Legend'):
-    
+def create_lineplot(data, title, xlabel, ylabel, figsize=(14, 8), linewidth=2, legend_title='Legend', output=None):
+    import matplotlib.pyplot as plt
+
     data.plot(kind='line', figsize=figsize, linewidth=linewidth)
-    
+
     plt.title(title)
     plt.xlabel(xlabel)
     plt.ylabel(ylabel)
     plt.legend(title=legend_title, bbox_to_anchor=(1.05, 1), loc='upper left')  # Adjust legend placement
     plt.tight_layout()
-    plt.show()
-
-create_lineplot(
-    data=binned_data_top_10,
-    title='Chronological Trends of Top 10 Motifs (Line Plot)',
-    xlabel='50-Year Time Bin',
-    ylabel='Frequency',
-    figsize=(14, 8),
-    linewidth=2,
-    legend_title='Motifs'
-)
-
-# create Line Plot for Motif Groups 
-
-create_lineplot(
-    data=binned_group_data_top_10,
-    title='Chronological Trends of Top 10 Motif Groups (Line Plot)',
-    xlabel='50-Year Time Bin',
-    ylabel='Frequency',
-    figsize=(14, 8),
-    linewidth=2,
-    legend_title='Motif Groups'
-)
-
-# Create Heatmap 
-
-def create_heatmap(data, title, xlabel, ylabel, cmap='coolwarm', figsize=(12, 8), colorbar_label='Frequency'):
+    show_or_save(output)
+
+# Create Heatmap
+def create_heatmap(data, title, xlabel, ylabel, cmap='coolwarm', figsize=(12, 8), colorbar_label='Frequency', output=None):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.figure(figsize=figsize)
     sns.heatmap(data, cmap=cmap, cbar_kws={'label': colorbar_label})
     plt.title(title)
     plt.xlabel(xlabel)
     plt.ylabel(ylabel)
     plt.tight_layout()
-    plt.show()
-
-create_heatmap(binned_data_top_25.T, 'Chronological Trends of Top 25 Motifs (Heatmap)', 
-               'Average Date', 'Motifs', cmap='coolwarm', figsize=(14, 8))
-
-create_heatmap(binned_group_data_top_10.T, 'Chronological Trends of Top 10 Motif Groups (Heatmap)', 
-               'Average Date', 'Motif Groups', cmap='coolwarm', figsize=(14, 8))
+    show_or_save(output)
 
 
 ### --- GEOGRAPHICAL TRENDS --- ###
 
-# load world geometries 
-world = gpd.read_file('mapdata/ne_110m_admin_0_countries.shp')
-country_counts = df['country'].value_counts().reset_index()
-country_counts.columns = ['country', 'count']
+# clipped world geometries and boundary segments, loaded once per process from the geometry cache
+world_cache = {}
 
-# merge world DataFrame with the country counts
-world = world.merge(country_counts, how="left", left_on="ADMIN", right_on="country")
+def cached_world():
+    if 'world' not in world_cache:
+        world_cache['world'], world_cache['segments'] = load_world()
+    return world_cache['world'], world_cache['segments']
 
 # map motifs to colors
 def map_colors(unique_motifs, default_color='white', color_map='tab10'):
-    colors = colormaps[color_map] 
+    from matplotlib import colormaps
+
+    colors = colormaps[color_map]
     motif_color_map = {motif: colors(i) for i, motif in enumerate(unique_motifs)}
     return motif_color_map
 
 # plot world map with motifs
-def plot_motif_map(world, unique_motifs, motif_color_map, title, default_color='white'):
+def plot_motif_map(world, segments, unique_motifs, motif_color_map, title, default_color='white', output=None):
+    import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
+
     world['color'] = world['common_motif'].map(motif_color_map).fillna(default_color)
-    
+
     # figure and axis
     fig, ax = plt.subplots(1, 1, figsize=(15, 10))
-    world.boundary.plot(ax=ax, linewidth=1, color='k')  # boundaries
     world.plot(color=world['color'], ax=ax, legend=False)  # fill countries
-    
+    add_base_layer(ax, segments, color='k')  # cached boundaries
+
     plt.title(title)
-    
+
     # legend
     legend_elements = [Line2D([0], [0], marker='o', color='w', label=str(motif),
                                markerfacecolor=motif_color_map[motif], markersize=10)
@@ -208,105 +127,280 @@ def plot_motif_map(world, unique_motifs, motif_color_map, title, default_color='
     legend_elements.append(Line2D([0], [0], marker='o', color='w', label='Not in Dataset',
                                    markerfacecolor=default_color, markersize=10))
     ax.legend(handles=legend_elements, title="Most Common Motif", loc='upper right')
-    plt.show()
-
-# flatten the motif list for easier counting
-motif_with_country = df.explode('motif_list')[['country', 'motif_list', 'average_date']]
+    show_or_save(output)
 
-# show top motifs for each country (total, before and after 350 a.c.)
-def process_motifs(world, motif_with_country, title, year_filter=None):
-   
-    motif_with_country['average_date'] = pd.to_numeric(motif_with_country['average_date'], errors='coerce')
+# find the top motif for each map geometry (total, before and after 350 a.c.)
+def most_common_motifs(cube, country_index, year_filter=None):
 
-    if year_filter == 'before':
-        motif_data = motif_with_country[motif_with_country['average_date'] < 350]
-    elif year_filter == 'after':
-        motif_data = motif_with_country[motif_with_country['average_date'] >= 350]
-    else:
-        motif_data = motif_with_country  # No filter applied
-
-    if motif_data.empty:
-        print(f"No data found for motifs {year_filter}.")
-        return
+    # count motifs by country, restricted to the era if requested
+    motif_counts = cube_counts(cube, 'motif', ['country', 'item'], era=year_filter)
+    if motif_counts.empty:
+        return None
 
-    # croup motifs by country and count occurrences
-    motif_counts = motif_data.groupby(['country', 'motif_list']).size().reset_index(name='counts')
-    most_common_motif = motif_counts.loc[motif_counts.groupby('country')['counts'].idxmax()]
-    most_common_motif = most_common_motif.rename(columns={'motif_list': 'common_motif'})
+    return most_common_by_geometry(motif_counts, country_index)
 
-    # merge the motifs into the world GeoDataFrame
-    world_with_motif = world.merge(most_common_motif, how="left", left_on="ADMIN", right_on="country")
+# show top motifs for each country
+def process_motifs(common_motif, title, output=None):
 
-    # handle potential column name conflicts
-    if 'common_motif_y' in world_with_motif.columns:
-        world_with_motif = world_with_motif.rename(columns={'common_motif_y': 'common_motif'})
+    # the motifs are indexed by geometry id, the row of the world GeoDataFrame
+    world, segments = cached_world()
+    world_with_motif = world.assign(common_motif=common_motif.values)
 
     # map colors
     unique_motifs = world_with_motif['common_motif'].dropna().unique()
     motif_color_map = map_colors(unique_motifs)
 
     # plot results
-    plot_motif_map(world_with_motif, unique_motifs, motif_color_map, title)
-
+    plot_motif_map(world_with_motif, segments, unique_motifs, motif_color_map, title, output=output)
 
-process_motifs(world, motif_with_country, "Most Common Motif by Country")
-process_motifs(world, motif_with_country, "Most Common Motif by Country (Before Year 350)", year_filter='before')
-process_motifs(world, motif_with_country, "Most Common Motif by Country (After Year 350)", year_filter='after')
+# calculate total finds before and after the year 350 for each map geometry
+def calculate_finds(cube, country_index):
+    return pd.DataFrame({
+        'total_finds_before': sum_by_geometry(cube_counts(cube, 'motif', ['country'], era='before'), country_index),
+        'total_finds_after': sum_by_geometry(cube_counts(cube, 'motif', ['country'], era='after'), country_index),
+        'total_finds_all_years': sum_by_geometry(cube_counts(cube, 'motif', ['country']), country_index),
+    })
 
+# bins for classifications
+boundaries = [1, 5, 10, 15, 20, 50, 100, 200, 600]
 
-# calculate total finds before and after the year 350
-def calculate_finds(motif_with_country, year_threshold=350):
-    # count finds before 
-    finds_before = motif_with_country[motif_with_country['average_date'] < year_threshold]
-    total_finds_before = finds_before.groupby('country').size().reset_index(name='total_finds_before')
-
-    # count finds after 
-    finds_after = motif_with_country[motif_with_country['average_date'] >= year_threshold]
-    total_finds_after = finds_after.groupby('country').size().reset_index(name='total_finds_after')
-
-    # count total finds for all years
-    total_finds_all_years = motif_with_country.groupby('country').size().reset_index(name='total_finds_all_years')
-    
-    return total_finds_before, total_finds_after, total_finds_all_years
-
-total_finds_all_years, total_finds_before, total_finds_after = calculate_finds(motif_with_country)
-
-# merge finds data into world GeoDataFrame
-world = world.merge(total_finds_before, how="left", left_on="ADMIN", right_on="country", suffixes=('', '_before'))
-world = world.merge(total_finds_after, how="left", left_on="ADMIN", right_on="country", suffixes=('', '_after'))
-world = world.merge(total_finds_all_years, how="left", left_on="ADMIN", right_on="country", suffixes=('', '_all'))
+# color palette and boundary norm to categorize colors
+def finds_colors():
+    import seaborn as sns
+    from matplotlib.colors import BoundaryNorm
 
-# drop duplicate 'country' columns 
-world.drop(columns=['country_after', 'country_all'], inplace=True, errors='ignore')
+    palette = sns.color_palette("viridis", as_cmap=True).reversed()
+    return palette, BoundaryNorm(boundaries, palette.N, clip=True)
 
-# fill missing values with 0 for plotting
-world['total_finds_all_years'].replace(0, float('nan'), inplace=True)
-world['total_finds_before'].replace(0, float('nan'), inplace=True)
-world['total_finds_after'].replace(0, float('nan'), inplace=True)
+# plot finds
+def plot_finds(finds, column, title, output=None):
+    import matplotlib.pyplot as plt
 
-# color palette
-palette = sns.color_palette("viridis", as_cmap=True).reversed()
-# bins for classifications
-boundaries = [1, 5, 10, 15, 20, 50, 100, 200, 600]
-# boundary norm to categorize colors
-norm = BoundaryNorm(boundaries, palette.N, clip=True)
+    palette, norm = finds_colors()
+    # finds are indexed by geometry id, countries without finds stay empty for plotting
+    world, segments = cached_world()
+    gdf = world.assign(**{column: finds[column].values})
 
-# plot finds
-def plot_finds(gdf, column, title):
     fig, ax = plt.subplots(1, 1, figsize=(15, 10))
-    gdf.boundary.plot(ax=ax, linewidth=1)  # Draw the boundaries
-
     gdf.plot(column=column, ax=ax, legend=True,
                cmap=palette,
                norm=norm,
                legend_kwds={'label': title, 'orientation': "horizontal"},
                missing_kwds={"color": "lightgrey", "label": "No finds"})
-    
-    plt.title(title)
-    plt.show()
-
-
-plot_finds(world, 'total_finds_all_years', 'Total Finds by Country (All Years)')
-plot_finds(world, 'total_finds_before', 'Total Finds by Country (Before Year 350)')
-plot_finds(world, 'total_finds_after', 'Total Finds by Country (After Year 350)')
+    add_base_layer(ax, segments, color='C0')  # cached boundaries
 
+    plt.title(title)
+    show_or_save(output)
+
+
+# slice the data of every figure from the cube: (file name, plot function, arguments)
+def build_figures(cube, country_index_path=COUNTRY_INDEX_PATH):
+    figures = []
+
+    # Get counts of all motifs and motif-groups
+    motif_counts = cube_counts(cube, 'motif', ['item']).sort_values(ascending=False, kind='stable')
+    motif_group_counts = cube_counts(cube, 'motif_group', ['item']).sort_values(ascending=False, kind='stable')
+    top_motif_groups = motif_group_counts.nlargest(10)
+    print(top_motif_groups)
+
+    figures.append(('01_Top25MostCommonMotifs.png', create_barplot, dict(
+        data=motif_counts.head(25), title='Top 25 Most Common Motifs', xlabel='Frequency', ylabel='Motifs', figsize=(10, 12))))
+    figures.append(('02_Top10MotifGroups.png', create_barplot, dict(
+        data=top_motif_groups, title='Top 10 Most Common Motif Groups', xlabel='Frequency', ylabel='Motif Groups', figsize=(12, 12))))
+
+    # Get count of the most common motifs by christian status
+    top_motifs = motif_counts.head(15).index
+    top_motif_counts = cube_counts(cube, 'motif', ['item', 'christian']).unstack(fill_value=0)
+    top_motif_counts = top_motif_counts[top_motif_counts.index.isin(top_motifs)]
+    # Reorder columns
+    top_motif_counts = top_motif_counts.reindex(columns=['yes', 'no'], fill_value=0)
+    # Filter and sort motifs with a "christian: yes" status
+    top_motif_counts_yes = top_motif_counts[top_motif_counts['yes'] > 0]
+    top_motif_counts_yes = top_motif_counts_yes.sort_values('yes', ascending=True)
+    figures.append(('03_Top10MotifsOnChristianEpitaphs.png', create_christian_barplot, dict(
+        top_motif_counts_yes=top_motif_counts_yes)))
+
+    # Group motifs and motif groups by date_bin, in the bin width the cube was built with
+    bin_width = cube.attrs.get('bin_width', BIN_WIDTH)
+    labels = cube_bin_labels(cube)
+    binned_data = cube_counts(cube, 'motif', ['date_bin', 'item']).unstack(fill_value=0).reindex(labels, fill_value=0)
+    binned_group_data = cube_counts(cube, 'motif_group', ['date_bin', 'item']).unstack(fill_value=0).reindex(labels, fill_value=0)
+
+    # calculate frequency of each motif and select the top 25 and top 10
+    top_25_motifs = binned_data.sum(axis=0).nlargest(25).index
+    top_10_motifs = binned_data.sum(axis=0).nlargest(10).index
+    binned_data_top_25 = binned_data[top_25_motifs]
+    binned_data_top_10 = binned_data[top_10_motifs]
+    # subset binned_group_data for the global top 10 motif groups
+    binned_group_data_top_10 = binned_group_data[top_motif_groups.index]
+
+    lineplot = dict(xlabel=f'{bin_width}-Year Time Bin', ylabel='Frequency', figsize=(14, 8), linewidth=2)
+    figures.append(('04_ChronologicalTrend_Top10Motifs_LinePlot.png', create_lineplot, dict(
+        data=binned_data_top_10, title='Chronological Trends of Top 10 Motifs (Line Plot)', legend_title='Motifs', **lineplot)))
+    figures.append(('05_ChronologicalTrend_Top10MotifGroups_LinePlot.png', create_lineplot, dict(
+        data=binned_group_data_top_10, title='Chronological Trends of Top 10 Motif Groups (Line Plot)', legend_title='Motif Groups', **lineplot)))
+
+    figures.append(('06_ChronologicalTrend_Top25Motifs_Heatmap.png', create_heatmap, dict(
+        data=binned_data_top_25.T, title='Chronological Trends of Top 25 Motifs (Heatmap)',
+        xlabel='Average Date', ylabel='Motifs', cmap='coolwarm', figsize=(14, 8))))
+    figures.append(('07_ChronologicalTrend_Top10MotifGroups_Heatmap.png', create_heatmap, dict(
+        data=binned_group_data_top_10.T, title='Chronological Trends of Top 10 Motif Groups (Heatmap)',
+        xlabel='Average Date', ylabel='Motif Groups', cmap='coolwarm', figsize=(14, 8))))
+
+    # integer geometry ids for the EDH country names
+    world, segments = cached_world()
+    country_index = load_country_index(cube, world, country_index_path)
+
+    # most common motif per country
+    for name, title, year_filter in [
+        ('08_GeographicalTrend_MostCommonMotif_Map.png', "Most Common Motif by Country", None),
+        ('09_GeographicalTrend_MostCommonMotif_before350.png', "Most Common Motif by Country (Before Year 350)", 'before'),
+        ('10_GeographicalTrend_MostCommonMotif_after350.png', "Most Common Motif by Country (After Year 350)", 'after'),
+    ]:
+        common_motif = most_common_motifs(cube, country_index, year_filter)
+        if common_motif is None:
+            print(f"No data found for motifs {year_filter}.")
+            continue
+        figures.append((name, process_motifs, dict(common_motif=common_motif, title=title)))
+
+    # total finds per country
+    finds = calculate_finds(cube, country_index)
+    figures.append(('11_GeographicalTrend_TotalFinds_Map.png', plot_finds, dict(
+        finds=finds, column='total_finds_all_years', title='Total Finds by Country (All Years)')))
+    figures.append(('12_GeographicalTrend_TotalFinds_before350.png', plot_finds, dict(
+        finds=finds, column='total_finds_before', title='Total Finds by Country (Before Year 350)')))
+    figures.append(('13_GeographicalTrend_TotalFinds_after350.png', plot_finds, dict(
+        finds=finds, column='total_finds_after', title='Total Finds by Country (After Year 350)')))
+
+    # plotting an empty frame fails, e.g. the Christian motifs of a corpus without Christian finds
+    kept = []
+    for name, function, kwargs in figures:
+        if figure_is_empty(kwargs):
+            print(f"No data for {name}, skipped.")
+            continue
+        kept.append((name, function, kwargs))
+    return kept
+
+
+# a figure without a single value to plot
+def figure_is_empty(kwargs):
+    if 'column' in kwargs:
+        return kwargs['finds'][kwargs['column']].dropna().empty
+    for value in kwargs.values():
+        if isinstance(value, pd.Series):
+            return value.dropna().empty
+        if isinstance(value, pd.DataFrame):
+            return value.dropna(how='all').empty
+    return False
+
+
+# hash of the plotting code and the data of one figure
+def figure_hash(function, kwargs):
+    digest = hashlib.sha256()
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    digest.update(function.__name__.encode('utf-8'))
+    for key, value in sorted(kwargs.items()):
+        digest.update(key.encode('utf-8'))
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            # hash the content, pickles of equal frames are not always byte-identical
+            digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+            digest.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode('utf-8'))
+        else:
+            digest.update(repr(value).encode('utf-8'))
+    return digest.hexdigest()
+
+def use_headless_backend():
+    import matplotlib
+    matplotlib.use('Agg')
+
+def render_figure(function, kwargs, output):
+    use_headless_backend()
+    function(**kwargs, output=output)
+    return output
+
+# render all figures to render_dir in a process pool, figures with unchanged input are skipped
+def render_all(figures, render_dir, workers=4):
+    os.makedirs(render_dir, exist_ok=True)
+    manifest_path = os.path.join(render_dir, RENDER_MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    pending = {}
+    skipped = 0
+    for name, function, kwargs in figures:
+        input_hash = figure_hash(function, kwargs)
+        if manifest.get(name) == input_hash and os.path.exists(os.path.join(render_dir, name)):
+            print(f"{name} unchanged, skipped")
+            skipped += 1
+            continue
+        pending[name] = (function, kwargs, input_hash)
+
+    failed = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=use_headless_backend) as executor:
+            futures = {
+                executor.submit(render_figure, function, kwargs, os.path.join(render_dir, name)): name
+                for name, (function, kwargs, input_hash) in pending.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    failed[name] = error
+                    manifest.pop(name, None)
+                    print(f"{name} failed: {error!r}")
+                    continue
+                manifest[name] = pending[name][2]
+                print(f"{name} rendered")
+    finally:
+        # the figures that did render are not rendered again, even if others failed
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(pending)} figures failed: {', '.join(sorted(failed))}") \
+            from next(iter(failed.values()))
+    return {'rendered': len(pending), 'skipped': skipped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse the filtered epitaphs.')
+    parser.add_argument('--input', default='data/filtered_data.json',
+                        help='filtered data (.json, .parquet or memory-mapped .arrow)')
+    parser.add_argument('--render-dir', default=None,
+                        help='render all figures headless into this directory (e.g. ../results/graphs) instead of showing them')
+    parser.add_argument('--workers', type=int, default=4, help='number of render processes for --render-dir')
+    parser.add_argument('--bin-width', type=int, choices=BIN_WIDTHS, default=BIN_WIDTH, metavar='YEARS',
+                        help=f'width of the chronological bins, {BIN_WIDTHS[0]} to {BIN_WIDTHS[-1]} years (default: {BIN_WIDTH})')
+    parser.add_argument('--weighting', choices=WEIGHTINGS, default='midpoint',
+                        help="'midpoint' counts a find in the bin of its average date, "
+                             "'overlap' spreads it over every bin its date range overlaps")
+    parser.add_argument('--chunk-size', type=int, default=100000,
+                        help='rows per chunk when building the cube from .parquet or .arrow data')
+    add_report_arguments(parser, ['cube', 'aggregation', 'rendering'])
+    args = parser.parse_args()
+    run = report_from_args('keyword_analysis', args)
+
+    # Load the motif count cube, it is only rebuilt when the filtered dataset or the binning changed
+    with run.stage('cube') as stage:
+        cube = load_cube(args.input, bin_width=args.bin_width, weighting=args.weighting, chunk_size=args.chunk_size)
+        stage.rows_out = len(cube)
+    with run.stage('aggregation', rows_in=len(cube)) as stage:
+        figures = build_figures(cube)
+        stage.rows_out = len(figures)
+
+    with run.stage('rendering', rows_in=len(figures)) as stage:
+        if args.render_dir:
+            stage.update(render_all(figures, args.render_dir, args.workers))
+        else:
+            for name, function, kwargs in figures:
+                function(**kwargs)
+    run.save()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import re
+import sys
+
+from lemmatizer import SUFFIXES, build_inflection_table
+from motif_matcher import MotifMatcher
+
+# compiled keywords, matcher and group index, shared by every stage
+ARTIFACT_PATH = 'data/cache/keywords.pkl'
+# bump when the content of the artifact changes
+ARTIFACT_VERSION = 2
+
+# the keywords go into the regex as they are, and a match has to start and end at a word boundary
+REGEX_CHARS = set('.^$*+?{}[]\\|()')
+WORD_CHAR = re.compile(r'\w')
+
+# Baseform mapping for "special" words
+baseform_mapping = {
+    "Delfin": "Delphine",
+    "Delfine": "Delphine",
+    "Delfinen": "Delphine",
+    "Delfins": "Delphine",
+    "Delphin": "Delphine",
+    "Delphins": "Delphine",
+    "Vögel": "Vogel",
+    "Bäume": "Baum",
+    "Früchte": "Frucht",
+    "Lämmer": "Lamm",
+    "Kantharoi": "Kantharos",
+    "Orant": "Orans",
+    "Orans": "Orans",
+    "Orantin": "Orans",
+    "Oranten": "Orans",
+    "Orante": "Orans",
+    "Christusmonogram": "Christusmonogramm",
+    "Christusmonogramms": "Christusmonogramm",
+    "Christusmonogramme": "Christusmonogramm",
+    "Christogram": "Christusmonogramm",
+    "Christograms": "Christusmonogramm",
+    "Christogramm": "Christusmonogramm",
+    "Christogramme": "Christusmonogramm",
+    "Staurogram": "Staurogramm",
+    "Kreuzzeichen": "Kreuz",
+    "ascia": "Ascia",
+    "Ω": "Alpha & Omega",
+    "ω": "Alpha & Omega",
+    "Alpha": "Alpha & Omega",
+    "Omega": "Alpha & Omega",
+    "alpha": "Alpha & Omega",
+    "omega": "Alpha & Omega",
+    "Girland": "Girlande",
+    "Efeurank": "Efeuranke",
+    "Weinrank": "Weinranke",
+    "Zang": "Zange",
+    "Zimmermanns": "Zimmermann",
+    "Olivenbaums": "Olivenbaum",
+    "Olivenbaumes": "Olivenbaum"
+}
+
+
+# Load keywords
+def load_keywords(file_path):
+    with open(file_path, 'r', encoding='utf-8') as keyword_file:
+        return [line.strip() for line in keyword_file.readlines() if line.strip()]
+
+
+# "Group: Motif, Motif, ..." per line
+def load_keyword_groups(file_path):
+    keyword_groups = {}
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            group_name, separator, motifs = line.partition(":")
+            if not separator or not group_name.strip():
+                raise ValueError(f'{file_path}:{number}: expected "Group: Motif, Motif, ...", got {line.strip()!r}')
+            group_name = group_name.strip()
+            if group_name in keyword_groups:
+                raise ValueError(f'{file_path}:{number}: group {group_name!r} is defined twice')
+            keyword_groups[group_name] = [motif.strip() for motif in motifs.split(",") if motif.strip()]
+    return keyword_groups
+
+
+def dedupe(items):
+    return list(dict.fromkeys(items))
+
+
+# check the keyword sources against each other, returns the deduplicated keywords and groups and the warnings.
+# Errors that would tag wrongly (a motif in two groups, chained baseforms) raise ValueError
+def validate(keywords, keyword_groups, baseform_mapping):
+    warnings = []
+
+    duplicates = sorted({keyword for keyword in keywords if keywords.count(keyword) > 1})
+    if duplicates:
+        warnings.append(f"duplicate keywords removed: {', '.join(duplicates)}")
+    keywords = dedupe(keywords)
+    for keyword in keywords:
+        if not WORD_CHAR.match(keyword[0]) or not WORD_CHAR.match(keyword[-1]):
+            raise ValueError(f'keyword {keyword!r} must start and end with a letter or digit')
+        if REGEX_CHARS & set(keyword):
+            raise ValueError(f"keyword {keyword!r} contains regex characters ({''.join(sorted(REGEX_CHARS & set(keyword)))})")
+
+    groups = {}
+    motif_to_group = {}
+    for group, motifs in keyword_groups.items():
+        if len(set(motifs)) < len(motifs):
+            warnings.append(f"duplicate motifs removed from group {group}")
+        groups[group] = dedupe(motifs)
+        for motif in groups[group]:
+            if motif in motif_to_group:
+                raise ValueError(f'motif {motif!r} is in the groups {motif_to_group[motif]!r} and {group!r}')
+            motif_to_group[motif] = group
+
+    for surface, motif in baseform_mapping.items():
+        if not isinstance(surface, str) or not isinstance(motif, str) or not surface or not motif:
+            raise ValueError(f'invalid baseform mapping entry {surface!r}: {motif!r}')
+        if motif != surface and baseform_mapping.get(motif, motif) != motif:
+            raise ValueError(f'baseform {surface!r} -> {motif!r} is mapped again to {baseform_mapping[motif]!r}')
+
+    # the motifs a row can get are the keywords and the baseforms they map to
+    motifs = {baseform_mapping.get(keyword, keyword) for keyword in keywords} | set(baseform_mapping.values())
+    unreachable = [motif for motif in motif_to_group if motif not in motifs]
+    if unreachable:
+        warnings.append(f"group motifs that no keyword produces: {', '.join(unreachable)}")
+    ungrouped = sorted(motif for motif in motifs if motif not in motif_to_group)
+    if ungrouped:
+        warnings.append(f"motifs without a group: {', '.join(ungrouped)}")
+
+    return keywords, groups, warnings
+
+
+# other keyword files get their own artifact next to the default one
+def artifact_path(keywords_path='keywords.txt', groups_path='keyword_groups.txt'):
+    if (keywords_path, groups_path) == ('keywords.txt', 'keyword_groups.txt'):
+        return ARTIFACT_PATH
+    sources = f'{os.path.abspath(keywords_path)}\n{os.path.abspath(groups_path)}'
+    root, extension = os.path.splitext(ARTIFACT_PATH)
+    return f'{root}-{hashlib.sha256(sources.encode("utf-8")).hexdigest()[:12]}{extension}'
+
+
+# hash of the keyword sources, the artifact is rebuilt when it changes
+def source_fingerprint(keywords_path, groups_path, baseform_mapping=baseform_mapping):
+    digest = hashlib.sha256()
+    for path in (keywords_path, groups_path):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    digest.update(json.dumps(baseform_mapping, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    digest.update(repr((ARTIFACT_VERSION, SUFFIXES)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def compile_keywords(keywords_path='keywords.txt', groups_path='keyword_groups.txt', baseform_mapping=baseform_mapping):
+    from result_cache import matchable_surfaces
+
+    keywords, keyword_groups, warnings = validate(
+        load_keywords(keywords_path), load_keyword_groups(groups_path), baseform_mapping
+    )
+    table = build_inflection_table(keywords, baseform_mapping)
+    return {
+        'version': ARTIFACT_VERSION,
+        'fingerprint': source_fingerprint(keywords_path, groups_path, baseform_mapping),
+        'keywords': keywords,
+        'keyword_groups': keyword_groups,
+        # Reverse the mapping to easily find the group for each motif
+        'motif_to_group': {motif: group for group, motifs in keyword_groups.items() for motif in motifs},
+        'baseform_mapping': dict(baseform_mapping),
+        'inflection_table': table,
+        'surfaces': matchable_surfaces(keywords, table),
+        'matcher': MotifMatcher(keywords),
+        'warnings': warnings,
+    }
+
+
+# load the compiled keywords, they are only compiled again when a source or the artifact version changed
+def load_artifact(keywords_path='keywords.txt', groups_path='keyword_groups.txt', path=None, rebuild=False):
+    path = path or artifact_path(keywords_path, groups_path)
+    fingerprint = source_fingerprint(keywords_path, groups_path)
+    if not rebuild and os.path.exists(path):
+        with open(path, 'rb') as f:
+            artifact = pickle.load(f)
+        if artifact.get('version') == ARTIFACT_VERSION and artifact.get('fingerprint') == fingerprint:
+            return artifact
+
+    artifact = compile_keywords(keywords_path, groups_path)
+    for warning in artifact['warnings']:
+        print(f'keywords: {warning}')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # written under another name first, parallel stages never read a half-written artifact
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+    return artifact
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate the keyword sources and compile them into the keyword artifact.')
+    parser.add_argument('--keywords', default='keywords.txt')
+    parser.add_argument('--groups', default='keyword_groups.txt')
+    parser.add_argument('--output', default=None, help=f'artifact file (default: {ARTIFACT_PATH})')
+    parser.add_argument('--force', action='store_true', help='compile even if the sources did not change')
+    parser.add_argument('--strict', action='store_true', help='exit with an error if the sources have warnings')
+    args = parser.parse_args()
+
+    try:
+        artifact = load_artifact(args.keywords, args.groups, args.output, rebuild=args.force)
+    except ValueError as error:
+        sys.exit(f'keywords: {error}')
+    print(f"{len(artifact['keywords'])} keywords, {len(artifact['keyword_groups'])} groups, "
+          f"{len(artifact['inflection_table'])} surface forms, fingerprint {artifact['fingerprint'][:12]} in {args.output or artifact_path(args.keywords, args.groups)}")
+    if args.strict and artifact['warnings']:
+        sys.exit(f"{len(artifact['warnings'])} warnings in the keyword sources")
+
+
+if __name__ == '__main__':
+    main()
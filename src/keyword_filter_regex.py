@@ -1,134 +1,107 @@
-import pandas as pd
+import argparse
 import json
 import re
-import stanza
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# Initialize Stanza pipeline
-nlp = stanza.Pipeline('de', processors='tokenize,mwt,pos,lemma')
-
-#load json dataset
-with open('data/results.json', 'r', encoding='utf-8') as file:
-    data = json.load(file)
-
-items = data['items']
-
-# convert to a DataFrame
-df = pd.json_normalize(items)
-
-# remove items marked as pagan
-filtered_df = df[df['religion'] != "names of pagan deities; cult functions, pagan"]
-
-# Remove items without commentary
-df = df[df['commentary'].notna() & (df['commentary'].str.strip() != '')]
-
-# Load keywords 
-with open('keywords.txt', 'r', encoding='utf-8') as keyword_file:
-    keywords = [line.strip() for line in keyword_file.readlines() if line.strip()]
+import api
+from compact_schema import memory_report
+from instrumentation import Stage, add_report_arguments, report_from_args
+from keyword_compiler import baseform_mapping
+from lemmatizer import StanzaLemmatizer, TableLemmatizer, agreement_report
+from result_cache import RESULT_CACHE_PATH
 
 # Generate regex patterns for keywords
-patterns = [rf'\b{keyword}(?:e|es|en|n|s)?\b' for keyword in keywords]
-combined_pattern = re.compile('|'.join(patterns), re.IGNORECASE)
-
-# Baseform mapping for "special" words 
-baseform_mapping = {
-    "Delfin": "Delphine",
-    "Delfine": "Delphine",
-    "Delfinen" "Delphine"
-    "Delfins": "Delphine",
-    "Delphin": "Delphine",
-    "Delphins": "Delphine",
-    "Vögel": "Vogel",
-    "Bäume": "Baum",
-    "Früchte": "Frucht",
-    "Lämmer": "Lamm",
-    "Kantharoi": "Kantharos",
-    "Orant": "Orans",
-    "Orans": "Orans",
-    "Orantin": "Orans",
-    "Oranten": "Orans",
-    "Orante": "Orans",
-    "Christusmonogram": "Christusmonogramm", 
-    "Christusmonogramms": "Christusmonogramm", 
-    "Christusmonogramme": "Christusmonogramm", 
-    "Christogram": "Christusmonogramm", 
-    "Christograms": "Christusmonogramm", 
-    "Christogramm": "Christusmonogramm",
-    "Christogramme": "Christusmonogramm",
-    "Staurogram": "Staurogramm", 
-    "Kreuzzeichen": "Kreuz",
-    "ascia": "Ascia",
-    "Ω": "Alpha & Omega",
-    "ω": "Alpha & Omega",
-    "Alpha": "Alpha & Omega", 
-    "Omega": "Alpha & Omega",
-    "alpha": "Alpha & Omega", 
-    "omega": "Alpha & Omega", 
-    "Girland": "Girlande",
-    "Efeurank": "Efeuranke",
-    "Weinrank": "Weinranke", 
-    "Zang": "Zange", 
-    "Zimmermanns": "Zimmermann", 
-    "Olivenbaums": "Olivenbaum", 
-    "Olivenbaumes": "Olivenbaum"
-}
-
-# Load keyword groups from external file
-def load_keyword_groups(file_path):
-    keyword_groups = {}
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if not line.strip():
-                continue
-            group_name, motifs = line.split(":", 1)
-            keyword_groups[group_name.strip()] = [motif.strip() for motif in motifs.split(",")]
-    return keyword_groups
-
-keyword_groups = load_keyword_groups('keyword_groups.txt')
-
-# Reverse the mapping to easily find the group for each motif
-motif_to_group = {motif: group for group, motifs in keyword_groups.items() for motif in motifs}
-
-# search for motifs in commentary-column
-def find_motifs_and_filter(commentary):
-    if isinstance(commentary, str):
-        matches = re.findall(combined_pattern, commentary)
-        lemmatized_motifs = set()
-        motif_groups_found = set()
-        
-        for match in matches:
-            # lemmatize matches 
-            doc = nlp(match)
-            for sentence in doc.sentences:
-                for word in sentence.words:
-                    lemma = word.lemma
-                    # map to baseform if necessary
-                    final_motif = baseform_mapping.get(lemma, lemma)
-                    lemmatized_motifs.add(final_motif)
-                    # Add the group if the motif is mapped to a group
-                    if final_motif in motif_to_group:
-                        motif_groups_found.add(motif_to_group[final_motif])
-
-          
-        # return sorted motifs as a comma-separated string
-        if lemmatized_motifs:
-             return {
-                'motifs': ', '.join(sorted(lemmatized_motifs)),
-                'motif_group': ', '.join(sorted(motif_groups_found))
-            }
-    
-    return None 
-
-# run find_motifs and create new column 'motifs' and 'motif_group'
-results = df['commentary'].apply(find_motifs_and_filter)
-df['motifs'] = results.apply(lambda x: x['motifs'] if x else None)
-df['motif_group'] = results.apply(lambda x: x['motif_group'] if x else None)
+def build_pattern(keywords):
+    patterns = [rf'\b{keyword}(?:e|es|en|n|s)?\b' for keyword in keywords]
+    return re.compile('|'.join(patterns), re.IGNORECASE)
 
-# filter only rows with motifs
-filtered_df = df[df['motifs'].notnull()]
-print(len(df))
+# collect keyword matches in commentary-column (trie matcher or compiled regex)
+def find_matches(commentary, matcher):
+    if isinstance(commentary, str):
+        return matcher.findall(commentary)
+    return []
+
+# search for motifs in the matches of one commentary
+def find_motifs_and_filter(matches, lemmas):
+    lemmatized_motifs = set()
+
+    for match in matches:
+        # look up the lemmas of the match
+        for lemma in lemmas[match]:
+            # map to baseform if necessary
+            final_motif = baseform_mapping.get(lemma, lemma)
+            lemmatized_motifs.add(final_motif)
+
+    # groups, the christian flag and the joined strings are derived from the motif matrix
+    return lemmatized_motifs or None
+
+# keyword matcher for the chosen mode, the trie comes precompiled in the keyword artifact
+def build_matcher(artifact, mode='trie'):
+    if mode == 'trie':
+        return artifact['matcher']
+    return build_pattern(artifact['keywords'])
+
+# build the lemmatizer for the chosen mode, together with the Stanza lemmatizer behind it
+def build_lemmatizer(artifact, mode='stanza'):
+    stanza_lemmatizer = StanzaLemmatizer(artifact['fingerprint'])
+    if mode == 'table':
+        # Stanza is only loaded for surface forms the table does not know
+        return TableLemmatizer(artifact['inflection_table'], fallback=stanza_lemmatizer), stanza_lemmatizer
+    return stanza_lemmatizer, stanza_lemmatizer
+
+# match and lemmatize a list of commentaries, every distinct surface form is lemmatized only once
+def tag_commentaries(commentaries, matcher, lemmatizer, stage=None):
+    matches = [find_matches(commentary, matcher) for commentary in commentaries]
+    surfaces = {match for row_matches in matches for match in row_matches}
+    lemmas = lemmatizer.lemmatize(surfaces)
+    results = [find_motifs_and_filter(row_matches, lemmas) for row_matches in matches]
+    if stage is not None:
+        stage.count('matches', sum(len(row_matches) for row_matches in matches))
+    return results, surfaces
+
+
+# matcher and lemmatizer of a worker process, built once by init_worker
+worker_state = {}
+
+def init_worker(artifact, matcher_mode, lemmatizer_mode):
+    worker_state['matcher'] = build_matcher(artifact, matcher_mode)
+    worker_state['lemmatizer'], worker_state['stanza_lemmatizer'] = build_lemmatizer(artifact, lemmatizer_mode)
+
+def tag_chunk(commentaries):
+    stanza_lemmatizer = worker_state['stanza_lemmatizer']
+    stage = Stage('chunk')
+    calls, cache_hits = stanza_lemmatizer.calls, stanza_lemmatizer.cache_hits
+    results, surfaces = tag_commentaries(commentaries, worker_state['matcher'], worker_state['lemmatizer'], stage)
+    stage.count('stanza_calls', stanza_lemmatizer.calls - calls)
+    stage.count('lemma_cache_hits', stanza_lemmatizer.cache_hits - cache_hits)
+    # hand the Stanza lemmas back so the parent can update the shared cache
+    new_lemmas = {surface: stanza_lemmatizer.cache[surface] for surface in surfaces if surface in stanza_lemmatizer.cache}
+    return results, surfaces, new_lemmas, stage.counters
+
+# split the commentaries into chunks and tag them in a process pool, results keep the row order
+def tag_commentaries_parallel(commentaries, artifact, matcher_mode, lemmatizer_mode,
+                              stanza_lemmatizer, workers, chunk_size=1000, stage=None):
+    chunks = [commentaries[start:start + chunk_size] for start in range(0, len(commentaries), chunk_size)]
+    chunk_results = [None] * len(chunks)
+    surfaces = set()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(artifact, matcher_mode, lemmatizer_mode)) as executor:
+        futures = {executor.submit(tag_chunk, chunk): index for index, chunk in enumerate(chunks)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            chunk_results[index], chunk_surfaces, new_lemmas, counters = future.result()
+            surfaces |= chunk_surfaces
+            stanza_lemmatizer.cache.update(new_lemmas)
+            if stage is not None:
+                stage.update(counters)
+            print(f"chunk {index + 1}/{len(chunks)} done ({len(chunks[index])} rows, {done}/{len(chunks)} finished)")
+
+    results = [result for chunk in chunk_results for result in chunk]
+    return results, surfaces
 
 # mark items as christian 
-def add_christian_column(filtered_df):
+def add_christian_column(filtered_df, motif_matrix):
     # Define criteria for determining if a result is Christian
     religion = [
         "cult functions, Jewish/Christian",
@@ -141,31 +114,92 @@ def add_christian_column(filtered_df):
         "Staurogramm"
     ]
 
-    religion_mask = filtered_df['religion'].isin(religion)
-    
-    motive_mask = filtered_df['motifs'].str.contains('|'.join(motifs), na=False)
+    religion_mask = filtered_df['religion'].isin(religion).to_numpy()
+
+    # motif columns are matched once, then the rows are checked with one sparse operation
+    motive_mask = motif_matrix.contains_any(motifs)
 
     # Combine both masks to determine if the result is Christian
-    filtered_df.loc[:, 'christian'] = (religion_mask | motive_mask).replace({True: "yes", False: "no"})
+    filtered_df = filtered_df.assign(christian=religion_mask | motive_mask)
     
     return filtered_df
 
-# Add the 'christian' column to dataset
-filtered_df = add_christian_column(filtered_df)
-
-# Print the count of Christian items
-christian_count = filtered_df['christian'].value_counts().get("yes", 0)
-print(f'Number of Christian items: {christian_count}')
-
-# save new data to a JSON file
-filtered_df.to_json('data/filtered_data.json', orient='records', lines=False, force_ascii=False)
-
-# pretty print JSON
-with open('data/filtered_data.json', 'r', encoding='utf-8') as f:
-    filtered_data = json.load(f)
-
-with open('data/filtered_data.json', 'w', encoding='utf-8') as f:
-    json.dump(filtered_data, f, ensure_ascii=False, indent=2)
-
-# Save to CSV
-# filtered_df.to_csv('data/filtered_data.csv', index=False)
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description='Filter EDH epitaphs for figural motifs in the commentary.')
+    parser.add_argument('--input', default='data/results.json',
+                        help='downloaded EDH results (.json, or line-delimited .jsonl)')
+    parser.add_argument('--format', choices=['json', 'parquet', 'arrow'], default='json',
+                        help='output format, parquet/arrow store motifs as list columns and christian as a boolean')
+    parser.add_argument('--output', default=None, help='output file (default: data/filtered_data.<format>)')
+    parser.add_argument('--pretty', action='store_true', help='pretty-print the JSON output')
+    parser.add_argument('--lemmatizer', choices=['stanza', 'table'], default='stanza',
+                        help="'table' resolves matches from a precomputed inflection table and only falls back to Stanza for unknown forms")
+    parser.add_argument('--matcher', choices=['trie', 'regex'], default='trie',
+                        help="'trie' scans each commentary once, 'regex' uses the combined alternation pattern")
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes, each with its own matcher and lemmatizer')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help='number of commentaries per worker task')
+    parser.add_argument('--agreement-report', action='store_true',
+                        help='compare the table lemmatizer against Stanza and save the result in data/lemmatizer_agreement.json')
+    parser.add_argument('--cache', default=RESULT_CACHE_PATH,
+                        help='per-inscription result cache, unchanged rows are not tagged again')
+    parser.add_argument('--cache-size', type=int, default=1000000,
+                        help='maximum number of cached rows, the least recently used rows are evicted')
+    parser.add_argument('--no-cache', action='store_true', help='tag every row and leave the result cache alone')
+    parser.add_argument('--no-compact', action='store_true',
+                        help='keep religion, country, province and the dates as object columns')
+    add_report_arguments(parser, ['ingest', 'cache_lookup', 'tagging', 'cache_store', 'agreement_report', 'christian', 'save'])
+    args = parser.parse_args()
+    run = report_from_args('keyword_filter_regex', args)
+
+    # stream the dataset, pagan items and items without commentary are dropped per record
+    # repetitive strings become categories and the dates small ints while the chunks are read
+    with run.stage('ingest') as stage:
+        memory = {}
+        df = api.load_corpus(args.input, compact=not args.no_compact, memory=memory)
+        stage.rows_out = len(df)
+        stage.update({name: round(value, 2) for name, value in memory.items()})
+        if not args.no_compact:
+            print(memory_report(memory['object_mb'], memory['compact_mb']))
+
+    # motifs of every row, rows whose commentary and relevant keywords did not change are served from the result cache.
+    # The agreement report needs the surface forms of every row, so it tags them all
+    surfaces = set() if args.agreement_report else None
+    motif_matrix = api.match_motifs(df, args.matcher, args.lemmatizer, args.workers, args.chunk_size,
+                                    None if args.no_cache else args.cache, cache_size=args.cache_size,
+                                    run=run, surfaces=surfaces)
+
+    if args.agreement_report:
+        state = api.tagger(args.matcher, args.lemmatizer)
+        with run.stage('agreement_report', rows_in=len(surfaces)):
+            report = agreement_report(surfaces, TableLemmatizer(state['artifact']['inflection_table']),
+                                      state['stanza_lemmatizer'], baseform_mapping)
+            with open('data/lemmatizer_agreement.json', 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"Table/Stanza agreement: {report['agreement']:.1%} of {report['total']} surface forms")
+        if state['stanza_lemmatizer'].cache:
+            state['stanza_lemmatizer'].save()
+
+    with run.stage('christian', rows_in=len(df)) as stage:
+        print(len(df))
+
+        # keep the rows with motifs and add the 'christian' column
+        filtered_df, motif_matrix = api.classify_christian(df, motif_matrix)
+
+        # Print the count of Christian items
+        christian_count = int(filtered_df['christian'].sum())
+        print(f'Number of Christian items: {christian_count}')
+        stage.rows_out = len(filtered_df)
+        stage.count('christian', christian_count)
+
+    # save new data, as JSON or in a columnar format
+    with run.stage('save', rows_in=len(filtered_df)):
+        api.save_filtered(filtered_df, motif_matrix, args.output, args.format, pretty=args.pretty)
+    run.save()
+
+    # Save to CSV
+    # filtered_df.to_csv('data/filtered_data.csv', index=False)
+
+if __name__ == '__main__':
+    main()
@@ -1,79 +1,144 @@
-import pandas as pd
+import argparse
 import json
-import stanza
-import re
 
+from ingest import load_corpus
+from keyword_compiler import load_artifact
+from motif_matcher import WORD_PATTERN
 
-#initialize stanza
-# stanza.download('de')
-nlp = stanza.Pipeline('de')
-
-
-#load dataset
-with open('results.json', 'r', encoding='utf-8') as file:
-    data = json.load(file)
-
-items = data['items']
-df = pd.json_normalize(items)
+# umlauts are folded for the prefilter, so that "Bäume" and "Vögel" reach the keywords "Baum" and "Vogel"
+FOLD = str.maketrans({'ä': 'a', 'ö': 'o', 'ü': 'u', 'ß': 'ss'})
 
-# Remove items marked as pagan
-df = df[df['religion'] != "names of pagan deities; cult functions, pagan"]
 
-# Remove items without commentary
-df = df[df['commentary'].notna() & (df['commentary'].str.strip() != '')]
+#initialize stanza
+# stanza.download('de')
+def build_pipeline(mode, pos_batch_size=3000, lemma_batch_size=3000):
+    import stanza
 
-# load keyword-list
-with open('keywords.txt', 'r', encoding='utf-8') as keyword_file:
-    keywords = [line.strip() for line in keyword_file.readlines() if line.strip()]
+    if mode == 'document':
+        return stanza.Pipeline('de')
+    # only what the noun extraction needs, German needs mwt between tokenize and pos
+    return stanza.Pipeline(
+        'de', processors='tokenize,mwt,pos,lemma', use_gpu=False,
+        pos_batch_size=pos_batch_size, lemma_batch_size=lemma_batch_size
+    )
 
 # load list of to be excluded phrases
 #with open('excluded_phrases.txt', 'r', encoding='utf-8') as phrase_file:
 #    excluded_phrases = [line.strip() for line in phrase_file if line.strip()]
 
-keywords_set = set(keywords)
+# folded keyword stems, inflected forms only change the last letters ("Kantharos" -> "Kantharoi")
+def build_prefixes(keywords):
+    prefixes = set()
+    for keyword in keywords:
+        folded = keyword.lower().translate(FOLD)
+        prefixes.add(folded[:max(3, len(folded) - 2)])
+    return prefixes
+
+# cheap check whether a commentary could contain a motif: some word starts with a keyword stem
+def could_contain_motif(commentary, prefixes, lengths):
+    if not isinstance(commentary, str):
+        return False
+    words = WORD_PATTERN.findall(commentary.lower().translate(FOLD))
+    return any(word[:length] in prefixes for word in words for length in lengths)
+
+# Match the noun lemmas of one stanza document with keywords
+def motifs_of_document(doc, keywords_set):
+    motifs = set()
+
+    # Extract nouns from commentary
+    nouns = [
+        word.lemma for sentence in doc.sentences for word in sentence.words if word.upos == "NOUN"
+    ]
+
+    # Match lemmas with keywords
+    for noun in nouns:
+        if noun in keywords_set:
+            motifs.add(noun)
+
+    if motifs:
+        return ', '.join(sorted(motifs))
+    return None
 
-# Search for keywords in commentary column
-def find_motifs_and_filter(commentary):
+# Search for keywords in commentary column, one commentary per stanza call
+def find_motifs_and_filter(commentary, nlp, keywords_set):
     if isinstance(commentary, str):
-        
+
         # Remove excluded phrases
         #for phrase in excluded_phrases:
         #    commentary = commentary.replace(phrase, "")
 
-        motifs = set()
-
-        # Extract nouns from commentary
-        doc = nlp(commentary)
-        nouns = [
-            word.lemma for sentence in doc.sentences for word in sentence.words if word.upos == "NOUN"
-        ]
-
-        # Match lemmas with keywords
-        for noun in nouns:
-            if noun in keywords_set:  
-                motifs.add(noun)
-
-        if motifs:
-            return ', '.join(sorted(motifs))  
+        return motifs_of_document(nlp(commentary), keywords_set)
     return None
 
-# Apply the function to the commentary column
-df['motifs'] = df['commentary'].apply(find_motifs_and_filter)
-
-# Filter dataset to show only items with motifs
-df = df[df['motifs'].notnull()]
-
-# Convert to JSON
-df.to_json('filtered_data.json', orient='records', lines=False, force_ascii=False)
-
-# Make JSON pretty
-with open('filtered_data.json', 'r', encoding='utf-8') as f:
-    filtered_data = json.load(f)
-
-with open('filtered_data.json', 'w', encoding='utf-8') as f:
-    json.dump(filtered_data, f, ensure_ascii=False, indent=2)
-
-print(f"Length of filtered filtered_data: {len(filtered_data)}")
-print(df[['commentary', 'motifs']])
-
-
+# throughput mode: prefilter, then lemmatize many commentaries per bulk stanza call
+def find_motifs_batched(commentaries, nlp, keywords, batch_size=1000, prefilter=True):
+    from stanza import Document
+
+    keywords_set = set(keywords)
+    prefixes = build_prefixes(keywords)
+    lengths = sorted({len(prefix) for prefix in prefixes})
+
+    results = [None] * len(commentaries)
+    candidates = [
+        i for i, commentary in enumerate(commentaries)
+        if isinstance(commentary, str) and (not prefilter or could_contain_motif(commentary, prefixes, lengths))
+    ]
+    print(f"{len(candidates)} of {len(commentaries)} commentaries passed the prefilter")
+
+    for start in range(0, len(candidates), batch_size):
+        batch = candidates[start:start + batch_size]
+        # the sentences of the whole batch are processed together in pos/lemma batches
+        docs = nlp([Document([], text=commentaries[i]) for i in batch])
+        for i, doc in zip(batch, docs):
+            results[i] = motifs_of_document(doc, keywords_set)
+        print(f"{min(start + batch_size, len(candidates))}/{len(candidates)} commentaries lemmatized")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Filter EDH epitaphs for motifs among the noun lemmas of the commentary.')
+    parser.add_argument('--input', default='results.json')
+    parser.add_argument('--output', default='filtered_data.json')
+    parser.add_argument('--mode', choices=['document', 'batched'], default='document',
+                        help="'document' runs the full pipeline per commentary, 'batched' runs tokenize/mwt/pos/lemma over many commentaries at once")
+    parser.add_argument('--batch-size', type=int, default=1000, help='commentaries per stanza call in batched mode')
+    parser.add_argument('--pos-batch-size', type=int, default=3000)
+    parser.add_argument('--lemma-batch-size', type=int, default=3000)
+    parser.add_argument('--no-prefilter', action='store_true',
+                        help='send every commentary to stanza in batched mode, not only those with a keyword stem')
+    args = parser.parse_args()
+
+    nlp = build_pipeline(args.mode, args.pos_batch_size, args.lemma_batch_size)
+
+    #load dataset, pagan items and items without commentary are dropped while streaming
+    df = load_corpus(args.input)
+
+    # the validated, deduplicated keywords of the keyword artifact
+    keywords = load_artifact('keywords.txt', 'keyword_groups.txt')['keywords']
+
+    # Apply the function to the commentary column
+    if args.mode == 'batched':
+        df['motifs'] = find_motifs_batched(
+            df['commentary'].tolist(), nlp, keywords, args.batch_size, prefilter=not args.no_prefilter
+        )
+    else:
+        keywords_set = set(keywords)
+        df['motifs'] = df['commentary'].apply(find_motifs_and_filter, nlp=nlp, keywords_set=keywords_set)
+
+    # Filter dataset to show only items with motifs
+    df = df[df['motifs'].notnull()]
+
+    # Convert to JSON
+    df.to_json(args.output, orient='records', lines=False, force_ascii=False)
+
+    # Make JSON pretty
+    with open(args.output, 'r', encoding='utf-8') as f:
+        filtered_data = json.load(f)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(filtered_data, f, ensure_ascii=False, indent=2)
+
+    print(f"Length of filtered filtered_data: {len(filtered_data)}")
+    print(df[['commentary', 'motifs']])
+
+if __name__ == '__main__':
+    main()
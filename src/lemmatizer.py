@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+from importlib.metadata import PackageNotFoundError, version
+
+# persistent surface form -> lemma cache, reused across runs
+LEMMA_CACHE_PATH = 'data/cache/lemma_cache.json'
+
+# suffixes allowed by the keyword regex, also used to generate plural/genitive variants
+SUFFIXES = ['e', 'es', 'en', 'n', 's']
+
+# where stanza keeps its models, the same default as stanza.resources.common.DEFAULT_MODEL_DIR
+STANZA_RESOURCES_DIR = os.environ.get('STANZA_RESOURCES_DIR', os.path.join(os.path.expanduser('~'), 'stanza_resources'))
+
+
+# installed stanza version, the lemmas change with it
+def stanza_version():
+    try:
+        return version('stanza')
+    except PackageNotFoundError:
+        # table-only installs without stanza still get a stable fingerprint
+        return 'no-stanza'
+
+
+# hash of the German model entries (package names and md5 of every model file) in the stanza resources.
+# A re-downloaded or updated model changes the lemmas under the same stanza version
+def stanza_model_version(language='de', resources_dir=None):
+    path = os.path.join(resources_dir or STANZA_RESOURCES_DIR, 'resources.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            resources = json.load(f)
+    except (OSError, ValueError):
+        return 'no-model'
+    entry = resources.get(language, {})
+    if 'alias' in entry:
+        entry = resources.get(entry['alias'], {})
+    return hashlib.sha256(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# fingerprint of the keyword artifact, the stanza version and its German model, used to invalidate the cache
+def cache_fingerprint(artifact_fingerprint):
+    parts = [artifact_fingerprint, stanza_version(), stanza_model_version()]
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+# lemmatize distinct surface forms in batches and remember the results on disk
+class StanzaLemmatizer:
+
+    def __init__(self, artifact_fingerprint, cache_path=LEMMA_CACHE_PATH, batch_size=500):
+        self.cache_path = cache_path
+        self.batch_size = batch_size
+        self.fingerprint = cache_fingerprint(artifact_fingerprint)
+        self.cache = self._load_cache()
+        self.nlp = None
+        # counters for the run report
+        self.calls = 0
+        self.cache_hits = 0
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        # drop the cache if the keyword sources or the stanza model changed
+        if cached.get('fingerprint') != self.fingerprint:
+            return {}
+        return cached.get('lemmas', {})
+
+    # the model is only loaded when there is something the cache does not know
+    def _pipeline(self):
+        if self.nlp is None:
+            import stanza
+            self.nlp = stanza.Pipeline('de', processors='tokenize,mwt,pos,lemma')
+        return self.nlp
+
+    # return a dict surface form -> list of lemmas
+    def lemmatize(self, surfaces):
+        missing = sorted({s for s in surfaces if s not in self.cache})
+        self.cache_hits += len(set(surfaces)) - len(missing)
+        if missing:
+            from stanza import Document
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            # one stanza call for the whole batch (multi-document input)
+            docs = self._pipeline()([Document([], text=surface) for surface in batch])
+            self.calls += 1
+            for surface, doc in zip(batch, docs):
+                self.cache[surface] = [
+                    word.lemma for sentence in doc.sentences for word in sentence.words
+                ]
+
+        return {s: self.cache[s] for s in surfaces}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'lemmas': self.cache}, f, ensure_ascii=False, indent=2)
+
+
+# precomputed inflection table: lowercased surface form -> canonical motif
+def build_inflection_table(keywords, baseform_mapping):
+    table = {}
+    words = list(keywords) + list(baseform_mapping)
+
+    # generated plural/genitive variants first, so exact forms win on collisions
+    for suffix in SUFFIXES:
+        for word in words:
+            table[(word + suffix).lower()] = baseform_mapping.get(word, word)
+
+    for keyword in keywords:
+        table[keyword.lower()] = baseform_mapping.get(keyword, keyword)
+
+    # irregular forms ("Vögel", "Lämmer", "Kantharoi") have the last word
+    for surface, motif in baseform_mapping.items():
+        table[surface.lower()] = motif
+
+    return table
+
+
+# resolve matches with a dict lookup, Stanza is only used for unknown surface forms
+class TableLemmatizer:
+
+    def __init__(self, table, fallback=None):
+        self.table = table
+        self.fallback = fallback
+
+    def lemmatize(self, surfaces):
+        lemmas = {}
+        unknown = []
+        for surface in surfaces:
+            motif = self.table.get(surface.lower())
+            if motif is None:
+                unknown.append(surface)
+            else:
+                lemmas[surface] = [motif]
+
+        if unknown:
+            if self.fallback is not None:
+                lemmas.update(self.fallback.lemmatize(unknown))
+            else:
+                lemmas.update({surface: [surface] for surface in unknown})
+
+        return lemmas
+
+    def save(self):
+        if self.fallback is not None and self.fallback.nlp is not None:
+            self.fallback.save()
+
+
+# compare the table lookup with the Stanza lemmas for the given surface forms
+def agreement_report(surfaces, table_lemmatizer, stanza_lemmatizer, baseform_mapping):
+    surfaces = sorted(surfaces)
+    stanza_lemmas = stanza_lemmatizer.lemmatize(surfaces)
+
+    disagreements = []
+    unknown = 0
+    for surface in surfaces:
+        table_motif = table_lemmatizer.table.get(surface.lower())
+        stanza_motifs = [baseform_mapping.get(lemma, lemma) for lemma in stanza_lemmas[surface]]
+        if table_motif is None:
+            unknown += 1
+        if [table_motif] != stanza_motifs:
+            disagreements.append({'surface': surface, 'table': table_motif, 'stanza': stanza_motifs})
+
+    total = len(surfaces)
+    return {
+        'total': total,
+        'agreeing': total - len(disagreements),
+        'agreement': (total - len(disagreements)) / total if total else 1.0,
+        'unknown_to_table': unknown,
+        'disagreements': disagreements
+    }
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from chronology import END, START, bin_edges, bin_labels, bin_weights, date_ranges, iter_filtered_chunks
+
+CUBE_DIR = 'data/cache'
+
+# default 50-year bins
+BIN_WIDTH = 50
+BINS = list(bin_edges(BIN_WIDTH))
+LABELS = bin_labels(BINS)
+
+# 'midpoint' counts every find once in the bin of its average date, 'overlap' spreads it over its date range
+WEIGHTINGS = ['midpoint', 'overlap']
+
+# finds before and after this year are mapped separately
+ERA_YEAR = 350
+
+DIMENSIONS = ['date_bin', 'country', 'province', 'christian', 'era']
+COLUMNS = ['kind', 'item'] + DIMENSIONS + ['count']
+
+
+# one cube per bin width, weighting and year range, so switching between them does not rebuild
+def default_cube_path(bin_width=BIN_WIDTH, weighting='midpoint', years=(START, END), root=CUBE_DIR):
+    span = '' if tuple(years) == (START, END) else f'{years[0]}-{years[1]}_'
+    return os.path.join(root, f'motif_cube_{span}{bin_width}_{weighting}.pkl')
+
+
+# the time bin labels of a cube, in order
+def cube_bin_labels(cube):
+    return bin_labels(bin_edges(cube.attrs.get('bin_width', BIN_WIDTH), *cube.attrs.get('years', (START, END))))
+
+
+# fingerprint of the filtered data and the binning, the cube is rebuilt when it changes
+def source_fingerprint(path, bins=BINS, era_year=ERA_YEAR, weighting='midpoint'):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(repr((list(bins), era_year, weighting, DIMENSIONS)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# pair the (row, name) facets with the time bins of their rows and sum the weights over all dimensions.
+# With 'overlap' a row is paired once per bin it overlaps and the counts are fractional.
+# Without facets the motifs and motif groups are split from the joined strings of the JSON output
+def build_cube(df, bin_width=BIN_WIDTH, weighting='midpoint', era_year=ERA_YEAR, years=(START, END), facets=None):
+    from filtered_io import string_facet
+
+    facets = facets or {'motif': string_facet(df['motifs']), 'motif_group': string_facet(df['motif_group'])}
+    edges = bin_edges(bin_width, *years)
+    # bin -1 (undated or outside the bins) picks the trailing None
+    labels = np.array(bin_labels(edges) + [None], dtype=object)
+    not_before, not_after = date_ranges(df)
+    rows, bins, weights = bin_weights(not_before, not_after, edges, weighting)
+
+    # the era is decided by the average date in both modes
+    average_date = (not_before + not_after) / 2
+    era = np.where(np.isnan(average_date), None, np.where(average_date < era_year, 'before', 'after'))
+
+    base = pd.DataFrame({
+        'country': df['country'].to_numpy(),
+        'province': df['province'].to_numpy() if 'province' in df else None,
+        'christian': df['christian'].to_numpy(),
+        'era': era,
+    })
+    binned = pd.DataFrame({'row': rows, 'date_bin': labels[bins], 'weight': weights})
+
+    counts = []
+    for kind in ['motif', 'motif_group']:
+        item_rows, items = facets[kind]
+        pairs = pd.DataFrame({'row': item_rows, 'item': items}).merge(binned, on='row')
+        pairs = pd.concat([pairs.drop(columns='row'), base.iloc[pairs['row']].reset_index(drop=True)], axis=1)
+        facet = pairs.groupby(['item'] + DIMENSIONS, dropna=False)['weight'].sum().reset_index(name='count')
+        counts.append(facet.assign(kind=kind))
+
+    cube = pd.concat(counts, ignore_index=True)[COLUMNS]
+    if weighting == 'midpoint':
+        cube['count'] = cube['count'].astype('int64')
+    cube.attrs.update(bin_width=bin_width, weighting=weighting, years=tuple(years))
+    return cube
+
+
+# add up cubes of separate chunks of the data
+def combine_cubes(cubes, bin_width=BIN_WIDTH, weighting='midpoint', years=(START, END)):
+    if cubes:
+        cube = pd.concat(cubes, ignore_index=True).groupby(['kind', 'item'] + DIMENSIONS, dropna=False)['count'].sum().reset_index()
+    else:
+        cube = pd.DataFrame({column: pd.Series(dtype='int64' if column == 'count' else object) for column in COLUMNS})
+    cube.attrs.update(bin_width=bin_width, weighting=weighting, years=tuple(years))
+    return cube[COLUMNS]
+
+
+# build the cube chunk by chunk, only one chunk of the filtered data and the partial cubes are in memory
+def build_cube_chunked(path, bin_width=BIN_WIDTH, weighting='midpoint', chunk_size=100000, era_year=ERA_YEAR, years=(START, END)):
+    partials = []
+    for chunk, facets in iter_filtered_chunks(path, chunk_size):
+        partials.append(build_cube(chunk, bin_width, weighting, era_year, years, facets))
+        # the partial cubes are much smaller than the data, but are still folded together now and then
+        if len(partials) >= 16:
+            partials = [combine_cubes(partials, bin_width, weighting, years)]
+    return combine_cubes(partials, bin_width, weighting, years)
+
+
+# load the cube from disk, or build and persist it if the filtered data or the binning changed
+def load_cube(path, cube_path=None, bin_width=BIN_WIDTH, weighting='midpoint', chunk_size=100000, years=(START, END)):
+    cube_path = cube_path or default_cube_path(bin_width, weighting, years)
+    fingerprint = source_fingerprint(path, bin_edges(bin_width, *years), weighting=weighting)
+    if os.path.exists(cube_path):
+        with open(cube_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['fingerprint'] == fingerprint:
+            return cached['cube']
+
+    cube = build_cube_chunked(path, bin_width, weighting, chunk_size, years=years)
+    os.makedirs(os.path.dirname(cube_path), exist_ok=True)
+    with open(cube_path, 'wb') as f:
+        pickle.dump({'fingerprint': fingerprint, 'cube': cube}, f)
+    return cube
+
+
+# sum the counts of one facet by the given dimensions, e.g. by=['date_bin', 'item'], era='before'
+def cube_counts(cube, kind, by, **filters):
+    selected = cube[cube['kind'] == kind]
+    for dimension, value in filters.items():
+        if value is not None:
+            selected = selected[selected[dimension] == value]
+    return selected.groupby(by)['count'].sum()
@@ -0,0 +1,83 @@
+import re
+
+from lemmatizer import SUFFIXES
+
+# word tokens, the same boundaries as \b in the keyword regex
+WORD_PATTERN = re.compile(r'\w+')
+WORD_CHAR = re.compile(r'\w')
+
+# marks the end of a keyword in the trie, holds the position of the keyword in the list
+END = None
+
+
+# single-pass keyword matcher, equivalent to the alternation of r'\bkeyword(?:e|es|en|n|s)?\b'
+class MotifMatcher:
+
+    def __init__(self, keywords, suffixes=SUFFIXES):
+        self.suffixes = {''} | set(suffixes)
+        # the order the regex tries the suffixes in
+        self.suffix_order = list(suffixes) + ['']
+        self.root = {}
+        # keywords of several tokens, e.g. 'Alpha & Omega', need the walk over the whole text
+        self.multi_word = False
+        for position, keyword in enumerate(keywords):
+            node = self.root
+            for char in keyword.lower():
+                node = node.setdefault(char, {})
+            node.setdefault(END, position)
+            self.multi_word = self.multi_word or WORD_PATTERN.fullmatch(keyword) is None
+
+    # a token matches if it is a keyword followed by one of the allowed suffixes
+    def _matches(self, token):
+        node = self.root
+        for position, char in enumerate(token):
+            if END in node and token[position:] in self.suffixes:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return END in node
+
+    # end of a suffix at position that is followed by a word boundary, or None
+    def _suffix_end(self, text, position):
+        for suffix in self.suffix_order:
+            end = position + len(suffix)
+            if text[position:end].lower() == suffix and WORD_CHAR.match(text, end) is None:
+                return end
+        return None
+
+    # end of the match starting at start, like the alternation the first keyword in the list wins
+    def _match_end(self, text, start):
+        node = self.root
+        best = None
+        for position in range(start, len(text) + 1):
+            if END in node and (best is None or node[END] < best[0]):
+                end = self._suffix_end(text, position)
+                if end is not None:
+                    best = (node[END], end)
+            if position == len(text):
+                break
+            node = node.get(text[position].lower())
+            if node is None:
+                break
+        return None if best is None else best[1]
+
+    # return all matches in order of appearance, like re.findall
+    def findall(self, commentary):
+        if not self.multi_word:
+            return [
+                word.group() for word in WORD_PATTERN.finditer(commentary)
+                if self._matches(word.group().lower())
+            ]
+
+        # a keyword can span tokens, so the trie walks the text from every token that is not part of a match
+        matches = []
+        matched_until = 0
+        for word in WORD_PATTERN.finditer(commentary):
+            if word.start() < matched_until:
+                continue
+            end = self._match_end(commentary, word.start())
+            if end is not None:
+                matches.append(commentary[word.start():end])
+                matched_until = end
+        return matches
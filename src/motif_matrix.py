@@ -0,0 +1,69 @@
+import numpy as np
+from scipy import sparse
+
+
+# sparse boolean rows x motifs membership matrix, with a motifs x groups matrix from keyword_groups.txt
+class MotifMatrix:
+
+    def __init__(self, matrix, motifs, groups, group_matrix):
+        self.matrix = matrix
+        self.motifs = motifs
+        self.groups = groups
+        self.group_matrix = group_matrix
+
+    # build the matrix from one set of motifs (or None) per row, columns are sorted alphabetically
+    @classmethod
+    def from_rows(cls, rows, motif_to_group):
+        motifs = sorted({motif for row in rows if row for motif in row})
+        column = {motif: i for i, motif in enumerate(motifs)}
+
+        indptr = [0]
+        indices = []
+        for row in rows:
+            if row:
+                indices.extend(sorted(column[motif] for motif in row))
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=bool), indices, indptr), shape=(len(rows), len(motifs))
+        )
+
+        groups = sorted({motif_to_group[motif] for motif in motifs if motif in motif_to_group})
+        group_column = {group: i for i, group in enumerate(groups)}
+        grouped = [i for i, motif in enumerate(motifs) if motif in motif_to_group]
+        group_matrix = sparse.csr_matrix(
+            (np.ones(len(grouped), dtype=bool),
+             (grouped, [group_column[motif_to_group[motifs[i]]] for i in grouped])),
+            shape=(len(motifs), len(groups))
+        )
+        return cls(matrix, motifs, groups, group_matrix)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def take(self, mask):
+        return MotifMatrix(self.matrix[np.flatnonzero(mask)], self.motifs, self.groups, self.group_matrix)
+
+    def has_motifs(self):
+        return np.diff(self.matrix.indptr) > 0
+
+    # rows x groups membership
+    def group_membership(self):
+        return (self.matrix.astype(np.int32) @ self.group_matrix.astype(np.int32)) > 0
+
+    # rows that contain a motif whose name contains one of the given names
+    def contains_any(self, names):
+        columns = [i for i, motif in enumerate(self.motifs) if any(name in motif for name in names)]
+        return np.asarray(self.matrix[:, columns].sum(axis=1)).ravel() > 0
+
+    # per-row lists of names, only needed when exporting
+    def motif_lists(self):
+        return rows_to_lists(self.matrix.tocsr(), self.motifs)
+
+    def group_lists(self):
+        return rows_to_lists(sparse.csr_matrix(self.group_membership()), self.groups)
+
+
+def rows_to_lists(matrix, names):
+    matrix.sort_indices()
+    names = np.asarray(names, dtype=object)
+    return [list(names[matrix.indices[start:end]]) for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:])]
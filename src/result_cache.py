@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from lemmatizer import SUFFIXES, stanza_model_version, stanza_version
+from motif_matcher import WORD_PATTERN
+
+RESULT_CACHE_PATH = 'data/cache/results.sqlite'
+
+# returned by lookup for rows that have to be tagged again
+MISS = object()
+
+
+# rows without an id are keyed by their commentary
+def cache_key(record_id, commentary):
+    if record_id is None or record_id != record_id:
+        return text_hash(commentary)
+    return str(record_id)
+
+
+def text_hash(text):
+    return hashlib.sha256((text if isinstance(text, str) else '').encode('utf-8')).hexdigest()
+
+
+# fingerprint of everything that decides the motifs of a commentary: the keyword artifact, which covers
+# keywords.txt, keyword_groups.txt and the baseform mapping, and the lemmatizer
+def keyword_fingerprint(artifact_fingerprint, lemmatizer_mode):
+    parts = [artifact_fingerprint, lemmatizer_mode]
+    # Stanza lemmas change with the Stanza version and its German model, the table lemmas do not
+    if lemmatizer_mode == 'stanza':
+        parts += [stanza_version(), stanza_model_version()]
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+# motif of every lowercased form the matcher can find, two of these are diffed after a keyword change
+def matchable_surfaces(keywords, table, suffixes=SUFFIXES):
+    surfaces = {}
+    for keyword in keywords:
+        for suffix in [''] + list(suffixes):
+            surface = (keyword + suffix).lower()
+            surfaces[surface] = table.get(surface)
+    return surfaces
+
+
+# persistent per-inscription motif cache, keyed by inscription id, commentary hash and keyword fingerprint
+class ResultCache:
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_entries=1000000):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.max_entries = max_entries
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS results (
+                id TEXT PRIMARY KEY, text_hash TEXT NOT NULL, fingerprint TEXT NOT NULL,
+                motifs TEXT, last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+            CREATE TABLE IF NOT EXISTS fingerprints (fingerprint TEXT PRIMARY KEY, surfaces TEXT NOT NULL);
+        ''')
+        self.changed_surfaces_memo = {}
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'changed_text': 0, 'changed_keywords': 0, 'evicted': 0}
+
+    # remember the matchable surfaces of a keyword fingerprint, to find out later which surfaces changed
+    def register_fingerprint(self, fingerprint, surface_table):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO fingerprints (fingerprint, surfaces) VALUES (?, ?)',
+                (fingerprint, json.dumps(surface_table, ensure_ascii=False))
+            )
+
+    def _surfaces(self, fingerprint):
+        row = self.connection.execute('SELECT surfaces FROM fingerprints WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    # lowercased surface forms that match differently under the two fingerprints. A keyword of several words
+    # can only match where its first word is, so that word stands for it
+    def changed_surfaces(self, old_fingerprint, new_fingerprint):
+        key = (old_fingerprint, new_fingerprint)
+        if key not in self.changed_surfaces_memo:
+            old, new = self._surfaces(old_fingerprint), self._surfaces(new_fingerprint)
+            if old is None or new is None:
+                changed = None
+            else:
+                changed = {WORD_PATTERN.match(surface).group()
+                           for surface in set(old) | set(new) if old.get(surface) != new.get(surface)}
+            self.changed_surfaces_memo[key] = changed
+        return self.changed_surfaces_memo[key]
+
+    # a result under an older fingerprint is still valid if no word of the commentary is affected by the change
+    def _still_valid(self, commentary, old_fingerprint, fingerprint):
+        changed = self.changed_surfaces(old_fingerprint, fingerprint)
+        if changed is None:
+            return False
+        if not isinstance(commentary, str):
+            return True
+        return not any(word.group().lower() in changed for word in WORD_PATTERN.finditer(commentary))
+
+    def _rows(self, ids):
+        rows = {}
+        ids = list(ids)
+        # stay below the SQLite variable limit
+        for start in range(0, len(ids), 900):
+            batch = ids[start:start + 900]
+            query = f'SELECT id, text_hash, fingerprint, motifs FROM results WHERE id IN ({",".join("?" * len(batch))})'
+            for record_id, row_hash, row_fingerprint, motifs in self.connection.execute(query, batch):
+                rows[record_id] = (row_hash, row_fingerprint, motifs)
+        return rows
+
+    # cached motif sets (or None) per row, MISS for rows that have to be tagged
+    def lookup(self, ids, commentaries, fingerprint):
+        keys = [cache_key(record_id, commentary) for record_id, commentary in zip(ids, commentaries)]
+        rows = self._rows(set(keys))
+        results = []
+        revalidated = []
+
+        for key, commentary in zip(keys, commentaries):
+            row = rows.get(key)
+            if row is None:
+                self.stats['misses'] += 1
+                results.append(MISS)
+                continue
+            row_hash, row_fingerprint, motifs = row
+            if row_hash != text_hash(commentary):
+                self.stats['changed_text'] += 1
+                results.append(MISS)
+            elif row_fingerprint != fingerprint and not self._still_valid(commentary, row_fingerprint, fingerprint):
+                self.stats['changed_keywords'] += 1
+                results.append(MISS)
+            else:
+                if row_fingerprint == fingerprint:
+                    self.stats['hits'] += 1
+                else:
+                    self.stats['revalidated'] += 1
+                    revalidated.append(key)
+                results.append(set(json.loads(motifs)) if motifs else None)
+
+        # rows that survived a keyword change belong to the new fingerprint, and every used row is touched
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE results SET fingerprint = ? WHERE id = ?', [(fingerprint, key) for key in revalidated]
+            )
+            self.connection.executemany(
+                'UPDATE results SET last_used = ? WHERE id = ?', [(now, key) for key in keys if key in rows]
+            )
+        return results
+
+    def store(self, ids, commentaries, results, fingerprint):
+        now = time.time()
+        rows = [
+            (cache_key(record_id, commentary), text_hash(commentary), fingerprint,
+             json.dumps(sorted(result), ensure_ascii=False) if result else None, now)
+            for record_id, commentary, result in zip(ids, commentaries, results)
+        ]
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO results (id, text_hash, fingerprint, motifs, last_used) VALUES (?, ?, ?, ?, ?)', rows
+            )
+
+    # drop the least recently used rows above max_entries and fingerprints nothing refers to
+    def evict(self):
+        with self.connection:
+            cursor = self.connection.execute(
+                'DELETE FROM results WHERE id IN (SELECT id FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            self.stats['evicted'] += cursor.rowcount
+            self.connection.execute(
+                'DELETE FROM fingerprints WHERE fingerprint NOT IN (SELECT DISTINCT fingerprint FROM results)'
+            )
+
+    def report(self):
+        served = self.stats['hits'] + self.stats['revalidated']
+        total = served + self.stats['misses'] + self.stats['changed_text'] + self.stats['changed_keywords']
+        return (f"result cache: {served}/{total} rows served from cache "
+                f"({self.stats['hits']} hits, {self.stats['revalidated']} revalidated after a keyword change), "
+                f"{self.stats['misses']} new, {self.stats['changed_text']} changed commentaries, "
+                f"{self.stats['changed_keywords']} affected by keyword changes, {self.stats['evicted']} evicted")
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from api import tagger
+
+# limits of one request, larger batches should go through keyword_filter_regex.py
+MAX_ITEMS_PER_REQUEST = 1000
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# {"commentary": ..., "religion": ...} or {"items": [{"commentary": ..., "religion": ...}, ...]}
+def parse_items(payload):
+    if not isinstance(payload, dict):
+        raise RequestError(400, 'expected a JSON object')
+    single = 'items' not in payload
+    items = [payload] if single else payload['items']
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise RequestError(400, "'items' must be a list of objects")
+    if len(items) > MAX_ITEMS_PER_REQUEST:
+        raise RequestError(413, f'at most {MAX_ITEMS_PER_REQUEST} items per request')
+    for item in items:
+        if not isinstance(item.get('commentary'), str):
+            raise RequestError(400, "every item needs a 'commentary' string")
+    return single, items
+
+
+# matcher and lemmatizer stay warm, concurrent requests are tagged together in micro-batches
+class TaggingService:
+
+    def __init__(self, matcher='trie', lemmatizer='stanza', max_batch=512, max_wait=0.01, queue_size=100):
+        self.state = tagger(matcher, lemmatizer)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        # bounded queue of pending requests, a full queue is answered with 503
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = {'requests': 0, 'rejected': 0, 'batches': 0, 'rows': 0}
+
+    def warm_up(self):
+        if self.state['lemmatizer'] is self.state['stanza_lemmatizer']:
+            self.state['stanza_lemmatizer']._pipeline()
+
+    # tag the rows of several requests with one matcher pass and one lemmatizer call
+    def tag_rows(self, items):
+        import pandas as pd
+
+        from keyword_filter_regex import add_christian_column, tag_commentaries
+        from motif_matrix import MotifMatrix
+
+        results, _ = tag_commentaries([item['commentary'] for item in items], self.state['matcher'], self.state['lemmatizer'])
+        motif_matrix = MotifMatrix.from_rows(results, self.state['motif_to_group'])
+        religions = pd.DataFrame({'religion': [item.get('religion') for item in items]})
+        christian = add_christian_column(religions, motif_matrix)['christian'].tolist()
+        return [
+            {'motifs': motifs, 'motif_group': groups, 'christian': bool(flag)}
+            for motifs, groups, flag in zip(motif_matrix.motif_lists(), motif_matrix.group_lists(), christian)
+        ]
+
+    async def submit(self, items):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((items, future))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            raise RequestError(503, 'queue full, retry later')
+        self.stats['requests'] += 1
+        return await future
+
+    # collect requests until the batch is full or max_wait has passed, then tag them in the worker thread
+    async def batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            rows = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(request)
+                rows += len(request[0])
+
+            items = [item for request_items, _ in pending for item in request_items]
+            try:
+                # batches run one after another, so the lemmatizer is never used concurrently
+                tagged = await loop.run_in_executor(None, self.tag_rows, items)
+            except Exception as error:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.stats['batches'] += 1
+            self.stats['rows'] += len(items)
+
+            start = 0
+            for request_items, future in pending:
+                if not future.done():
+                    future.set_result(tagged[start:start + len(request_items)])
+                start += len(request_items)
+
+    async def handle(self, method, path, body):
+        if path == '/health':
+            return 200, {'status': 'ok', 'queue': self.queue.qsize(), **self.stats}
+        if path != '/tag':
+            raise RequestError(404, f'unknown path {path}')
+        if method != 'POST':
+            raise RequestError(405, 'use POST')
+        try:
+            payload = json.loads(body or b'null')
+        except ValueError:
+            raise RequestError(400, 'body is not valid JSON')
+        single, items = parse_items(payload)
+        tagged = await self.submit(items)
+        return 200, tagged[0] if single else {'items': tagged}
+
+    # minimal HTTP/1.1, one request per connection
+    async def serve_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_BYTES:
+                    raise RequestError(413, 'request body too large')
+                body = await reader.readexactly(length) if length else b''
+                status, response = await self.handle(method, path.split('?', 1)[0], body)
+            except RequestError as error:
+                status, response = error.status, {'error': str(error)}
+            except ValueError:
+                status, response = 400, {'error': 'malformed request'}
+            except Exception as error:
+                status, response = 500, {'error': repr(error)}
+
+            data = json.dumps(response, ensure_ascii=False).encode('utf-8')
+            head = [f'HTTP/1.1 {status} {REASONS[status]}', 'Content-Type: application/json; charset=utf-8',
+                    f'Content-Length: {len(data)}', 'Connection: close']
+            if status == 503:
+                head.append('Retry-After: 1')
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + data)
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8642, unix_socket=None):
+    batcher = asyncio.create_task(service.batcher())
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = await asyncio.start_unix_server(service.serve_connection, path=unix_socket)
+        print(f'tagging service listening on {unix_socket}')
+    else:
+        server = await asyncio.start_server(service.serve_connection, host, port)
+        print(f'tagging service listening on http://{host}:{port}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tag commentaries over HTTP with a warm matcher and lemmatizer.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8642)
+    parser.add_argument('--unix-socket', default=None, help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--lemmatizer', choices=['stanza', 'table'], default='stanza')
+    parser.add_argument('--matcher', choices=['trie', 'regex'], default='trie')
+    parser.add_argument('--max-batch', type=int, default=512, help='rows per shared lemmatizer call')
+    parser.add_argument('--max-wait-ms', type=float, default=10, help='how long a batch waits for more requests')
+    parser.add_argument('--queue-size', type=int, default=100, help='pending requests before new ones get a 503')
+    args = parser.parse_args()
+
+    async def run():
+        service = TaggingService(args.matcher, args.lemmatizer, args.max_batch, args.max_wait_ms / 1000, args.queue_size)
+        # load the Stanza model before the first request arrives
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, service.warm_up)
+        print(f'matcher and lemmatizer ready after {time.perf_counter() - start:.1f}s')
+        try:
+            await serve(service, args.host, args.port, args.unix_socket)
+        finally:
+            if service.state['stanza_lemmatizer'].cache:
+                service.state['stanza_lemmatizer'].save()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# the pipeline modules are flat scripts in src/ that read their inputs relative to the working directory
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+
+# a working directory with the keyword sources, caches and outputs go below it
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    for name in ('keywords.txt', 'keyword_groups.txt'):
+        shutil.copy(os.path.join(SRC_DIR, name), tmp_path / name)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+import api_client
+from api_client import checkpoint_dir_for, download, save_page
+from instrumentation import Stage
+
+QUERY = {'inschriftgattung': 'titsep', 'jahr_a': '200', 'jahr_b': '600'}
+TOTAL = 23
+PAGE_SIZE = 5
+
+
+def record(number):
+    return {'id': f'HD{number:06d}', 'commentary': f'Kreuz {number}'}
+
+
+# local EDH stub serving canned pages, failures[offset] is a list of status codes answered before the page
+class StubEDH:
+
+    def __init__(self, total=TOTAL):
+        self.total = total
+        self.failures = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                offset, limit = int(params['offset']), int(params['limit'])
+                with stub.lock:
+                    stub.requests.append(offset)
+                    failures = stub.failures.get(offset)
+                    status = failures.pop(0) if failures else 200
+                if status != 200:
+                    self.send_response(status)
+                    self.end_headers()
+                    return
+                items = [record(number) for number in range(offset, min(offset + limit, stub.total))]
+                body = json.dumps({'total': stub.total, 'limit': limit, 'offset': offset, 'items': items}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/data/api/inschrift/suche'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    with StubEDH() as server:
+        yield server
+
+
+# no backoff waits in the tests
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(api_client.time, 'sleep', lambda seconds: None)
+
+
+def run(stub, checkpoint_root, stage=None):
+    return download(QUERY, url=stub.url, checkpoint_root=str(checkpoint_root), page_size=PAGE_SIZE, workers=4, stage=stage)
+
+
+def test_pages_are_merged_in_offset_order(stub, tmp_path):
+    items = run(stub, tmp_path)
+    assert items == [record(number) for number in range(TOTAL)]
+    assert sorted(stub.requests) == [0, 5, 10, 15, 20]
+    # a complete download leaves no checkpoints behind
+    assert not os.path.exists(checkpoint_dir_for(QUERY, str(tmp_path)))
+
+
+def test_503_and_429_are_retried(stub, tmp_path):
+    stub.failures = {5: [503], 15: [429, 503]}
+    stage = Stage('download')
+    items = run(stub, tmp_path, stage)
+    assert items == [record(number) for number in range(TOTAL)]
+    assert stage.counters['retries'] == 3
+    assert sorted(stub.requests) == [0, 5, 5, 10, 15, 15, 15, 20]
+
+
+def test_other_client_errors_are_not_retried(stub, tmp_path):
+    stub.failures = {10: [404]}
+    with pytest.raises(requests.HTTPError):
+        run(stub, tmp_path)
+    assert stub.requests.count(10) == 1
+
+
+def test_interrupted_download_resumes_from_the_checkpoints(stub, tmp_path):
+    checkpoint_dir = checkpoint_dir_for(QUERY, str(tmp_path))
+    os.makedirs(checkpoint_dir)
+    for offset in (0, 10):
+        save_page(checkpoint_dir, offset, {'total': TOTAL, 'items': [record(number) for number in range(offset, offset + PAGE_SIZE)]})
+    # a page whose write was interrupted is fetched again
+    with open(os.path.join(checkpoint_dir, 'page_000000015.json.tmp'), 'w', encoding='utf-8') as f:
+        f.write('{"total": 23, "items": [{"id": "HD0000')
+
+    stage = Stage('download')
+    items = run(stub, tmp_path, stage)
+    assert items == [record(number) for number in range(TOTAL)]
+    assert sorted(stub.requests) == [5, 15, 20]
+    assert stage.counters['pages_from_checkpoint'] == 2
+    assert stage.counters['pages_downloaded'] == 3
+
+
+def test_finished_download_is_fetched_again(stub, tmp_path):
+    run(stub, tmp_path)
+    stub.total = TOTAL + 3
+    items = run(stub, tmp_path)
+    assert items == [record(number) for number in range(TOTAL + 3)]
+    assert len(stub.requests) == 5 + 6
@@ -0,0 +1,85 @@
+import json
+import os
+
+import pytest
+
+from tests.conftest import SRC_DIR
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import api_client
+from build_corpora import build_corpus, download_corpora
+
+
+def filtered_record(number, motifs, groups, christian, country='Italy'):
+    return {
+        'id': f'HD{number:06d}', 'commentary': f'mit {motifs}', 'religion': None,
+        'not_before': 300 + number, 'not_after': 400 + number, 'country': country, 'province': 'Italia',
+        'motifs': motifs, 'motif_group': groups, 'christian': christian,
+    }
+
+
+@pytest.fixture
+def corpus_workdir(workdir):
+    os.symlink(os.path.join(os.path.abspath(SRC_DIR), 'mapdata'), workdir / 'mapdata')
+    return workdir
+
+
+def build(records, name):
+    with open(f'{name}.json', 'w', encoding='utf-8') as f:
+        json.dump(records, f)
+    corpus = {'name': name, 'bin_width': 50, 'weighting': 'midpoint', 'years': (200, 650)}
+    return build_corpus(corpus, os.path.join('corpora', name), f'{name}.json', render_workers=1)
+
+
+def test_empty_corpus_renders_nothing(corpus_workdir):
+    summary = build([], 'empty')
+
+    assert summary == {'name': 'empty', 'cube_rows': 0, 'rendered': 0, 'skipped': 0}
+    assert not os.path.exists(os.path.join('corpora', 'empty', 'dashboard.html'))
+
+
+def test_corpus_without_christian_rows_skips_the_christian_figure(corpus_workdir):
+    records = [
+        filtered_record(1, 'Baum, Kreuz', 'Pflanzen, Symbole', 'no'),
+        filtered_record(2, 'Baum', 'Pflanzen', 'no', country='Austria'),
+        filtered_record(3, 'Kreuz', 'Symbole', 'no'),
+    ]
+    summary = build(records, 'pagan')
+
+    graphs = os.listdir(os.path.join('corpora', 'pagan', 'graphs'))
+    assert summary['rendered'] > 0
+    assert '01_Top25MostCommonMotifs.png' in graphs
+    assert '03_Top10MotifsOnChristianEpitaphs.png' not in graphs
+    assert os.path.exists(os.path.join('corpora', 'pagan', 'dashboard.html'))
+
+
+def test_province_slices_are_cut_from_the_whole_query(monkeypatch):
+    query = {'inschriftgattung': 'titsep', 'jahr_a': '200', 'jahr_b': '600'}
+    records = [
+        {'id': 'HD000001', 'province': 'Dalmatia'},
+        {'id': 'HD000002', 'province': 'Noricum'},
+        {'id': 'HD000003', 'province': 'Dal'},
+        {'id': 'HD000004', 'province': None},
+    ]
+    downloaded = []
+
+    def download(query, **kwargs):
+        downloaded.append(query)
+        return records
+
+    monkeypatch.setattr(api_client, 'download', download)
+    corpora = [
+        {'name': 'all', 'query': query, 'provinces': None},
+        {'name': 'dalmatia', 'query': query, 'provinces': ['Dal']},
+        {'name': 'noricum-raetia', 'query': query, 'provinces': ['Nor', 'Rae']},
+    ]
+    by_id, members = download_corpora(corpora, url='http://127.0.0.1:1', parallel=1)
+
+    assert downloaded == [query]
+    assert len(by_id) == 4
+    assert members == {
+        'all': ['HD000001', 'HD000002', 'HD000003', 'HD000004'],
+        'dalmatia': ['HD000001', 'HD000003'],
+        'noricum-raetia': ['HD000002'],
+    }
@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+
+from keyword_analysis import RENDER_MANIFEST, render_all
+
+
+def write_figure(text, output):
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def fail_figure(text, output):
+    raise ValueError(text)
+
+
+def test_failing_figure_keeps_the_rendered_ones_in_the_manifest(tmp_path):
+    figures = [
+        ('a.txt', write_figure, dict(text='a')),
+        ('broken.txt', fail_figure, dict(text='no data')),
+        ('b.txt', write_figure, dict(text='b')),
+    ]
+    with pytest.raises(RuntimeError, match='1 of 3 figures failed: broken.txt'):
+        render_all(figures, str(tmp_path), workers=2)
+
+    with open(tmp_path / RENDER_MANIFEST, 'r', encoding='utf-8') as f:
+        assert sorted(json.load(f)) == ['a.txt', 'b.txt']
+    assert render_all([figure for figure in figures if figure[0] != 'broken.txt'], str(tmp_path)) == \
+        {'rendered': 0, 'skipped': 2}
+    assert not os.path.exists(tmp_path / 'broken.txt')
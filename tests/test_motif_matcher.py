@@ -0,0 +1,63 @@
+import os
+import random
+
+import pytest
+
+from tests.conftest import SRC_DIR
+from keyword_compiler import load_keywords, validate
+from keyword_filter_regex import build_pattern
+from motif_matcher import MotifMatcher
+
+FILLER = ['Grabstein', 'mit', 'Inschrift', 'und', 'Darstellung', 'eines', 'im', 'Giebel', 'links', 'rechts']
+SUFFIXES = ['', 'e', 'es', 'en', 'n', 's', 'er', 'chen']
+
+
+def keywords():
+    return load_keywords(os.path.join(SRC_DIR, 'keywords.txt'))
+
+
+# keywords with allowed and other suffixes, in other cases, inside words and next to punctuation
+def commentaries(keywords, count, seed=7):
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(3, 20))]
+        for _ in range(rng.randint(0, 4)):
+            word = rng.choice(keywords) + rng.choice(SUFFIXES)
+            word = rng.choice([word, word.lower(), word.upper(), 'Vor' + word.lower(), word + '-' + rng.choice(FILLER)])
+            words.insert(rng.randrange(len(words) + 1), word + rng.choice(['', ',', '.', ')', ';']))
+        result.append(' '.join(words))
+    return result
+
+
+def test_trie_matches_regex_on_the_keyword_list():
+    keyword_list = keywords()
+    trie, regex = MotifMatcher(keyword_list), build_pattern(keyword_list)
+    for commentary in commentaries(keyword_list, 2000):
+        assert trie.findall(commentary) == regex.findall(commentary), commentary
+
+
+def test_trie_matches_regex_on_multi_word_and_unicode_keywords():
+    keyword_list = ['Alpha & Omega', 'Vögel', 'Ω', 'Kreuz']
+    trie, regex = MotifMatcher(keyword_list), build_pattern(keyword_list)
+    for commentary in ['Kreuze und Vögeln', 'ω Kreuzes', 'Ωs, KREUZEN', 'Ankreuz kreuzer', '',
+                       'Kreuz mit Alpha & Omega', 'ALPHA & OMEGAS.', 'Alpha & Omegakreuz', 'Alpha &  Omega', 'Alpha &']:
+        assert trie.findall(commentary) == regex.findall(commentary), commentary
+    assert trie.findall('Grabstein mit Alpha & Omega und Kreuz') == ['Alpha & Omega', 'Kreuz']
+
+
+# overlapping keywords: like the alternation, the keyword earlier in the list wins
+def test_trie_matches_regex_on_overlapping_keywords():
+    commentaries = ['Alpha & Omega', 'alpha und Omega', 'Alpha & Omega & Alpha', 'Anker Kreuz Kreuzanker']
+    for keyword_list in [['Alpha', 'Alpha & Omega', 'Omega'], ['Alpha & Omega', 'Alpha', 'Omega'],
+                         ['Kreuz', 'Anker Kreuz', 'Anker'], ['Anker Kreuz', 'Kreuz']]:
+        trie, regex = MotifMatcher(keyword_list), build_pattern(keyword_list)
+        for commentary in commentaries:
+            assert trie.findall(commentary) == regex.findall(commentary), (keyword_list, commentary)
+
+
+def test_validate_rejects_keywords_without_word_boundaries():
+    for keyword in ['Kreuz.', '& Omega', 'Kreu(z)']:
+        with pytest.raises(ValueError):
+            validate(['Anker', keyword], {}, {})
+    assert validate(['Anker', 'Alpha & Omega'], {}, {})[0] == ['Anker', 'Alpha & Omega']
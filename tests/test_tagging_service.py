@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import threading
+
+from tagging_service import TaggingService, serve
+
+
+# one HTTP/1.1 request over the Unix socket, returns status, headers and the decoded JSON body
+async def request(socket_path, method, path, payload=None):
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b'\r\n\r\n')
+    status_line, *header_lines = head.decode('latin-1').split('\r\n')
+    headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(':') for line in header_lines)}
+    return int(status_line.split()[1]), headers, json.loads(data)
+
+
+# start the service on a Unix socket in the working directory, run the test coroutine and shut it down again
+def run_service(service, test):
+    socket_path = os.path.abspath('tag.sock')
+
+    async def main():
+        server = asyncio.create_task(serve(service, unix_socket=socket_path))
+        while not os.path.exists(socket_path):
+            await asyncio.sleep(0.01)
+        try:
+            return await test(socket_path)
+        finally:
+            server.cancel()
+            await asyncio.gather(server, return_exceptions=True)
+
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_batches(workdir):
+    service = TaggingService(lemmatizer='table', max_wait=0.2)
+    commentaries = [f'Grabstein {number} mit Christusmonogramm und Vögeln' for number in range(20)]
+
+    async def test(socket_path):
+        responses = await asyncio.gather(*[
+            request(socket_path, 'POST', '/tag', {'commentary': commentary}) for commentary in commentaries
+        ])
+        batch = await request(socket_path, 'POST', '/tag', {'items': [
+            {'commentary': 'Kreuz', 'religion': None}, {'commentary': 'Inschrift', 'religion': 'Judaism / Christianity'},
+        ]})
+        health = await request(socket_path, 'GET', '/health')
+        return responses, batch, health
+
+    responses, batch, health = run_service(service, test)
+    for status, headers, body in responses:
+        assert status == 200
+        assert body == {'motifs': ['Christusmonogramm', 'Vogel'], 'motif_group': body['motif_group'], 'christian': True}
+        assert body['motif_group']
+    assert batch[0] == 200
+    assert [item['motifs'] for item in batch[2]['items']] == [['Kreuz'], []]
+    assert [item['christian'] for item in batch[2]['items']] == [True, True]
+
+    stats = health[2]
+    assert stats['requests'] == 21
+    assert stats['rows'] == 22
+    # the concurrent requests were tagged together
+    assert stats['batches'] < stats['requests']
+
+
+def test_full_queue_is_answered_with_503(workdir):
+    service = TaggingService(lemmatizer='table', max_batch=1, queue_size=1)
+    release = threading.Event()
+    tag_rows = service.tag_rows
+
+    # the first batch blocks the worker until the queue has been filled
+    def blocked_tag_rows(items):
+        release.wait(10)
+        return tag_rows(items)
+
+    service.tag_rows = blocked_tag_rows
+
+    async def wait_for(condition):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    async def test(socket_path):
+        first = asyncio.create_task(request(socket_path, 'POST', '/tag', {'commentary': 'Kreuz'}))
+        await wait_for(lambda: service.stats['requests'] == 1 and service.queue.qsize() == 0)
+        second = asyncio.create_task(request(socket_path, 'POST', '/tag', {'commentary': 'Fisch'}))
+        await wait_for(lambda: service.queue.qsize() == 1)
+        rejected = await request(socket_path, 'POST', '/tag', {'commentary': 'Taube'})
+        release.set()
+        return rejected, await first, await second
+
+    rejected, first, second = run_service(service, test)
+    status, headers, body = rejected
+    assert status == 503
+    assert headers['retry-after'] == '1'
+    assert 'queue full' in body['error']
+    assert first[0] == 200 and first[2]['motifs'] == ['Kreuz']
+    assert second[0] == 200 and second[2]['motifs'] == ['Fisch']
+    assert service.stats['rejected'] == 1
+
+
+def test_malformed_requests(workdir):
+    service = TaggingService(lemmatizer='table')
+
+    async def test(socket_path):
+        return await asyncio.gather(
+            request(socket_path, 'POST', '/tag', {'items': [{'religion': 'x'}]}),
+            request(socket_path, 'GET', '/tag'),
+            request(socket_path, 'POST', '/unknown', {}),
+        )
+
+    assert [status for status, _, _ in run_service(service, test)] == [400, 405, 404]